@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+pymlgame - Benchmarks
+=====================
+
+Some micro benchmarks for the hot paths of pymlgame. Run them with `python benchmark.py`.
+"""
+
+import time
+import itertools
+import socket
+import queue
+from threading import Thread
+
+import pymlgame
+
+SIZES = [(40, 16), (120, 48), (320, 128)]
+
+
+def rate(func, duration=1.0):
+    """
+    Call func as often as possible for about duration seconds.
+
+    :param func: Function to call
+    :param duration: Seconds to run
+    :type func: callable
+    :type duration: float
+    :return: Calls per second
+    :rtype: float
+    """
+    calls = 0
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        for _ in range(10):
+            func()
+        calls += 10
+        now = time.perf_counter()
+        if now >= end:
+            return calls / (now - start)
+
+
+def bench_serialize():
+    """
+    Frames per second that Screen can serialize (and send, as long as a frame fits in one datagram). Static means
+    nothing changed since the last frame.
+    """
+    print('Screen.serialize / Screen.update')
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    for width, height in SIZES:
+        screen = pymlgame.Screen('127.0.0.1', sink.getsockname()[1], width, height)
+        screen.fill(pymlgame.MAGENTA)
+        def full():
+            screen.mark_dirty()
+            screen.serialize()
+
+        line = '  {:>3}x{:<3} serialize: {:>12,.0f} frames/s'.format(width, height, rate(full))
+        line += '   static: {:>12,.0f} frames/s'.format(rate(screen.serialize))
+        indexed = pymlgame.Screen('127.0.0.1', sink.getsockname()[1], width, height, palette=[pymlgame.MAGENTA])
+
+        def full_indexed():
+            indexed.mark_dirty()
+            indexed.serialize()
+
+        line += '   indexed: {:>12,.0f} frames/s'.format(rate(full_indexed))
+        indexed.close()
+        if width * height * 3 + 4 <= 65507:
+            line += '   update: {:>10,.0f} frames/s'.format(rate(screen.update))
+        print(line)
+        screen.close()
+    sink.close()
+
+
+def handoff(put, drain, controllers, duration=1.0):
+    """
+    Push key events of many controllers from a second thread, like the controller thread does, and take them out in
+    the main thread.
+
+    :return: Events per second that arrived in the main thread
+    :rtype: float
+    """
+    uids = ['controller{}'.format(n) for n in range(controllers)]
+    done = []
+
+    def produce():
+        n = 0
+        while not done:
+            for uid in uids:
+                put(pymlgame.event.Event(uid, pymlgame.E_KEYDOWN, n % 14))
+            n += 1
+
+    producer = Thread(target=produce)
+    producer.start()
+    received = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        received += len(drain())
+    done.append(True)
+    producer.join()
+    return received / (time.perf_counter() - start)
+
+
+def bench_events():
+    """
+    Events per second through the handoff between controller thread and game, old queue.Queue drained one event at a
+    time against EventQueue drained at once.
+    """
+    print('controller -> game event handoff')
+    for controllers in [1, 20, 200]:
+        old = queue.Queue()
+
+        def drain_old():
+            events = []
+            while not old.empty():
+                events.append(old.get_nowait())
+            return events
+
+        new = pymlgame.event.EventQueue()
+        line = '  {:>4} controllers   queue.Queue: {:>12,.0f} events/s'.format(controllers,
+                                                                             handoff(old.put_nowait, drain_old,
+                                                                                     controllers))
+        line += '   EventQueue: {:>12,.0f} events/s'.format(handoff(new.put, new.drain, controllers))
+        print(line)
+
+
+def bench_parse():
+    """
+    Datagrams per second that the controller can parse and handle, for each command.
+    """
+    print('Controller._handle')
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    port = sink.getsockname()[1]
+    controller = pymlgame.Controller('127.0.0.1', 0)
+    uid = controller._new_controller('127.0.0.1', port)
+    # every new controller comes from another address, otherwise only the first one gets registered
+    fresh = ('127.{}.{}.{}'.format(n >> 16 & 255, n >> 8 & 255, n & 255) for n in itertools.count(1 << 16))
+    same = itertools.repeat('127.0.0.1')
+    packets = [('new', '/controller/new/{}'.format(port), fresh),
+               ('dup new', '/controller/new/{}'.format(port), same),
+               ('ping', '/controller/{}/ping/{}'.format(uid, port), same),
+               ('states', '/controller/{}/states/10100000000000'.format(uid), same),
+               ('text', '/controller/{}/text/hello world'.format(uid), same),
+               ('kthxbye', '/controller/{}/kthxbye'.format('unknown'), same),
+               ('malformed', '/controller/{}/dance'.format(uid), same)]
+    for name, packet, addresses in packets:
+        data = packet.encode('utf-8')
+
+        def handle():
+            controller._handle(data, next(addresses))
+            controller.queue.drain()
+
+        print('  {:<10} {:>12,.0f} packets/s'.format(name, rate(handle)))
+    controller.sock.close()
+    sink.close()
+
+
+def bench_registry():
+    """
+    Cost of registering, finding and removing controllers depending on how many are connected.
+    """
+    print('Controller registry')
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    port = sink.getsockname()[1]
+    for count in [10, 100, 1000, 5000]:
+        controller = pymlgame.Controller('127.0.0.1', 0)
+        addresses = ['127.1.{}.{}'.format(n // 250, n % 250 + 1) for n in range(count)]
+        start = time.perf_counter()
+        uids = [controller._new_controller(addr, port) for addr in addresses]
+        register = (time.perf_counter() - start) / count
+        controller.queue.drain()
+        states = [('/controller/{}/states/10000000000000'.format(uid).encode(), addr)
+                  for uid, addr in zip(uids, addresses)]
+        index = [0]
+
+        def update():
+            data, addr = states[index[0] % count]
+            index[0] += 1
+            controller._handle(data, addr)
+
+        update_rate = rate(update, 0.5)
+        controller.queue.drain()
+        duplicate_rate = rate(lambda: controller._new_controller(addresses[-1], port), 0.5)
+        start = time.perf_counter()
+        for uid in uids:
+            controller._del_controller(uid)
+        remove = (time.perf_counter() - start) / count
+        print('  {:>5} controllers   register: {:>6.1f} us   states: {:>10,.0f} packets/s   duplicate new: {:>10,.0f}/s'
+              '   remove: {:>6.1f} us'.format(count, register * 1e6, update_rate, duplicate_rate, remove * 1e6))
+        controller.sock.close()
+    sink.close()
+
+
+if __name__ == '__main__':
+    bench_serialize()
+    bench_events()
+    bench_parse()
+    bench_registry()
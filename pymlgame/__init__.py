@@ -13,51 +13,74 @@ __maintainer__ = 'Ricardo Band'
 __email__ = 'email@ricardo.band'
 __status__ = 'Development'
 
+import sys
+import socket
+
 from pymlgame.locals import *
 from pymlgame.screen import Screen
 from pymlgame.clock import Clock
+from pymlgame.loop import GameLoop
 from pymlgame.surface import Surface
+from pymlgame.sprite import Sprite, SpriteSheet
+from pymlgame.font import Font, Marquee
 from pymlgame.controller import Controller
+if sys.version_info >= (3, 7):
+    # asyncio support needs get_running_loop()
+    from pymlgame.aio import AsyncController, create_controller, ScreenProtocol, connect_screen, run_game_loop
+from pymlgame.sharded import ShardedController
+from pymlgame.profiler import PROFILER
 
 CONTROLLER = Controller()
 
 
-def init(host='0.0.0.0', port=1338):
+def init(host='0.0.0.0', port=1338, keypressed=True, timeout=60, rcvbuf=None, shards=0):
     """
     Initialize PyMLGame. This creates a controller thread that listens for game controllers and events.
 
+    With shards the datagrams of the controllers are parsed in that many processes, see ShardedController.
+
     :param host: Bind to this address
     :param port: Bind to this port
+    :param keypressed: Get E_KEYPRESSED events for held buttons with every states update of a controller
+    :param timeout: Disconnect controllers that haven't sent anything for this many seconds
+    :param rcvbuf: Size of the receive buffer of the controller socket in bytes, the system default if None
+    :param shards: Number of receiver processes, 0 to receive in a thread of the game process
     :type host: str
     :type port: int
+    :type keypressed: bool
+    :type timeout: float
+    :type rcvbuf: int
+    :type shards: int
     """
+    global CONTROLLER
+    if shards:
+        # the default controller holds the port
+        CONTROLLER.sock.close()
+        CONTROLLER = ShardedController(host, port, shards, keypressed, timeout, rcvbuf)
+        CONTROLLER.daemon = True
+        CONTROLLER.start()
+        return
     CONTROLLER.host = host
     CONTROLLER.port = port
+    CONTROLLER.keypressed = keypressed
+    CONTROLLER.timeout = timeout
+    if rcvbuf:
+        CONTROLLER.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
     CONTROLLER.setDaemon(True)  # because it's a deamon it will exit together with the main thread
     CONTROLLER.start()
 
 
-def get_events(maximum=10):
+def get_events(maximum=None):
     """
-    Get all events since the last time you asked for them. You can define a maximum which is 10 by default.
+    Get all events since the last time you asked for them. You can define a maximum, the oldest events are returned
+    then and the rest stays in the queue.
 
     :param maximum: Maximum number of events
     :type maximum: int
     :return: List of events
     :rtype: list
     """
-    events = []
-    for ev in range(0, maximum):
-        try:
-            if CONTROLLER.queue.empty():
-                break
-            else:
-                events.append(CONTROLLER.queue.get_nowait())
-        except NameError:
-            print('PyMLGame is not initialized correctly. Use pymlgame.init() first.')
-            events = False
-            break
-    return events
+    return CONTROLLER.queue.drain(maximum)
 
 
 def get_event():
@@ -67,7 +90,56 @@ def get_event():
     :return: Next controller event
     :rtype: Event or False
     """
-    if not CONTROLLER.queue.empty():
-        return CONTROLLER.queue.get_nowait()
+    events = CONTROLLER.queue.drain(1)
+    if events:
+        return events[0]
     else:
         return False
+
+
+def get_event_batch(maximum=None):
+    """
+    Like get_events(), but the events come as parallel arrays of uids, types, buttons, data and times.
+
+    :param maximum: Maximum number of events
+    :type maximum: int
+    :return: The events
+    :rtype: EventBatch
+    """
+    return CONTROLLER.queue.drain_batch(maximum)
+
+
+def subscribe(types=None, uids=None):
+    """
+    Choose which events get_events() returns, everything else is dropped as soon as it comes in.
+
+    :param types: Event types to get, all by default
+    :param uids: Unique ids of the controllers to get events from, all by default
+    :type types: list
+    :type uids: list
+    """
+    CONTROLLER.subscribe(types, uids)
+
+
+def get_states():
+    """
+    Get the buttons that are pressed right now on all controllers.
+
+    :return: uid -> (bitmask with bit n set while button n is pressed, time the controller was last seen)
+    :rtype: dict
+    """
+    return CONTROLLER.get_states()
+
+
+def is_pressed(uid, button):
+    """
+    Is a button pressed right now?
+
+    :param uid: Unique id of the controller
+    :param button: Button, one of the CTLR_* constants
+    :type uid: str
+    :type button: int
+    :rtype: bool
+    """
+    state = CONTROLLER.get_state(uid)
+    return state is not None and bool(state[0] >> button & 1)
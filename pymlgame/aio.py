@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+PyMLGame - asyncio
+"""
+
+import asyncio
+from inspect import isawaitable
+
+from pymlgame.controller import BaseController
+
+
+class AsyncController(BaseController, asyncio.DatagramProtocol):
+    """
+    The controller server as an asyncio protocol. It speaks the same protocol as Controller, but runs on the event
+    loop instead of in its own thread. Create it with create_controller().
+    """
+    def __init__(self, keypressed=True, timeout=60):
+        """
+        :param keypressed: Send E_KEYPRESSED events for every held button with every states update
+        :param timeout: Disconnect controllers that haven't sent anything for this many seconds
+        :type keypressed: bool
+        :type timeout: float
+        """
+        super(AsyncController, self).__init__(keypressed, timeout)
+        self.transport = None
+        self._events = asyncio.Event()
+        self._expiry = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._schedule_expiry()
+
+    def connection_lost(self, exc):
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
+    def datagram_received(self, data, addr):
+        self._handle(data, addr[0])
+        if not self.queue.empty():
+            self._events.set()
+
+    def _sendto(self, data, address):
+        self.transport.sendto(data, address)
+        return len(data)
+
+    def _schedule_expiry(self):
+        """
+        Disconnect unused controllers about once a second.
+        """
+        self._expire()
+        if not self.queue.empty():
+            self._events.set()
+        self._expiry = asyncio.get_running_loop().call_later(min(1.0, self.timeout), self._schedule_expiry)
+
+    async def get_events(self, maximum=None, timeout=None):
+        """
+        Get all events since the last time you asked for them. If there are none, wait for the next ones.
+
+        :param maximum: Maximum number of events
+        :param timeout: Wait at most this many seconds, forever by default
+        :type maximum: int
+        :type timeout: float
+        :return: List of events, empty if the timeout ran out
+        :rtype: list
+        """
+        if self.queue.empty():
+            self._events.clear()
+            try:
+                await asyncio.wait_for(self._events.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.queue.drain(maximum)
+
+    def close(self):
+        """
+        Stop listening.
+        """
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def create_controller(host='0.0.0.0', port=1338, keypressed=True, timeout=60):
+    """
+    Start an AsyncController on the running event loop.
+
+    :param host: Bind to address
+    :param port: Bind to port
+    :param keypressed: Send E_KEYPRESSED events for every held button with every states update
+    :param timeout: Disconnect controllers that haven't sent anything for this many seconds
+    :type host: str
+    :type port: int
+    :type keypressed: bool
+    :type timeout: float
+    :return: The controller
+    :rtype: AsyncController
+    """
+    loop = asyncio.get_running_loop()
+    transport, controller = await loop.create_datagram_endpoint(lambda: AsyncController(keypressed, timeout),
+                                                                local_addr=(host, port))
+    return controller
+
+
+class ScreenProtocol(asyncio.DatagramProtocol):
+    """
+    Sends the frames of a Screen through a datagram transport of the event loop, so a frame that can't be send right
+    away gets buffered instead of blocking the game. Create it with connect_screen().
+    """
+    def __init__(self, screen):
+        """
+        :param screen: The screen to send
+        :type screen: Screen
+        """
+        self.screen = screen
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        # e.g. nobody listens on Mate Light's port right now, the next frame may get through
+        pass
+
+    def update(self):
+        """
+        Like Screen.update(), but sends through the transport.
+
+        :return: Was the frame send?
+        :rtype: bool
+        """
+        # the transport is connected, so it already knows the address
+        return self.screen._send(self.transport.sendto, None)
+
+    def close(self):
+        """
+        Stop sending.
+        """
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def connect_screen(screen):
+    """
+    Get a ScreenProtocol for a screen on the running event loop.
+
+    :param screen: The screen to send
+    :type screen: Screen
+    :return: The protocol, call its update() instead of screen.update()
+    :rtype: ScreenProtocol
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(lambda: ScreenProtocol(screen),
+                                                              remote_addr=(screen.host, screen.port))
+    return protocol
+
+
+async def run_game_loop(game_loop):
+    """
+    Like GameLoop.run(), but as a coroutine on the asyncio event loop, so other tasks like an AsyncController keep
+    running while the game waits for its next tick or frame. The callbacks may be coroutine functions, they get awaited.
+
+    :param game_loop: The game loop to run
+    :type game_loop: GameLoop
+    """
+    try:
+        for wait in game_loop._steps():
+            if isawaitable(wait):
+                await wait
+            else:
+                await asyncio.sleep(wait)
+    finally:
+        game_loop.running = False
@@ -5,24 +5,74 @@ PyMLGame - Clock
 """
 
 import time
+from collections import deque
 
 
 class Clock(object):
     """
     Measure the time to adjust drawing rates.
+
+    Every tick waits for a deadline on a monotonic clock and the next deadline is exactly one frame later, so the time
+    the game needs for a frame doesn't slow it down and there is no drift over time.
     """
-    def __init__(self, fps):
+    def __init__(self, fps=30, spin=0.0):
         """
         Get a fresh Clock which ticks n times per second.
 
         :param fps: Target frames per second
+        :param spin: Busy wait for this many seconds at the end of a frame instead of sleeping, for more precise timing
         :type fps: int
+        :type spin: float
         """
         self.fps = fps
+        self.spin = spin
+        self.ticks = 0
+        self.frame_time = 0.0
+        self.overruns = 0
+        self._last = time.perf_counter()
+        self._deadline = self._last + 1.0 / fps
+        self._times = deque([self._last], maxlen=max(int(fps), 2))
+
+    @property
+    def actual_fps(self):
+        """
+        Frames per second measured over about the last second.
+        """
+        if len(self._times) < 2:
+            return 0.0
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
 
-    def tick(self):
+    def tick(self, fps=None):
         """
-        Let the Clock tick.
+        Let the Clock tick. This waits until the current frame is over.
+
+        :param fps: Change the target frames per second
+        :type fps: int
         """
-        #TODO: I think this is not the correct way. I should think about this again..
-        time.sleep(1.0 / self.fps)
+        if fps and fps != self.fps:
+            self.fps = fps
+            self._deadline = self._last + 1.0 / fps
+            self._times = deque(self._times, maxlen=max(int(fps), 2))
+        period = 1.0 / self.fps
+
+        now = time.perf_counter()
+        remaining = self._deadline - now
+        if remaining > 0:
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+            while time.perf_counter() < self._deadline:
+                pass
+            self._deadline += period
+        else:
+            self.overruns += 1
+            if -remaining > period:
+                # more than one frame behind, don't try to catch up
+                self._deadline = now + period
+            else:
+                self._deadline += period
+
+        now = time.perf_counter()
+        self.frame_time = now - self._last
+        self._last = now
+        self._times.append(now)
+        self.ticks += 1
@@ -6,36 +6,169 @@ PyMLGame - Controller
 
 from uuid import uuid4
 import time
+import heapq
+import select
 from datetime import datetime
 import socket
-from queue import Queue
 from threading import Thread
 
 from pymlgame.locals import E_NEWCTLR, E_DISCONNECT, E_PING, E_KEYUP, E_KEYDOWN, E_KEYPRESSED, E_MESSAGE, E_RUMBLE
-from pymlgame.event import Event
+from pymlgame.event import Event, EventQueue
 
+# what the game can send to the controllers
+SEND_PREFIXES = {E_MESSAGE: '/message/',
+                 E_RUMBLE: '/rumble/'}
 
-class Controller(Thread):
+
+def receive(sock, maximum):
     """
-    A controller can be a game controller attached to the system or any other input that can trigger the controller
-    functions like a smartphone app.
+    Read the datagrams that are waiting on a non blocking socket, but not more than maximum.
+
+    :param sock: The socket
+    :param maximum: Maximum number of datagrams
+    :type sock: socket.socket
+    :type maximum: int
+    :return: (data, (address, port)) for every datagram
+    :rtype: list
+    """
+    datagrams = []
+    recvfrom = sock.recvfrom
+    try:
+        while len(datagrams) < maximum:
+            datagrams.append(recvfrom(1024))
+    except (BlockingIOError, InterruptedError):
+        pass
+    except OSError:
+        # e.g. an ICMP error from an earlier send, just go on with what we got
+        pass
+    return datagrams
+
+
+def _port(arg):
+    """
+    Parse the port a controller listens on.
+
+    :param arg: Port as sent by the controller
+    :type arg: bytes
+    :return: The port
+    :rtype: int
+    :raises ValueError: If it isn't a number or not a valid port
     """
-    def __init__(self, host='0.0.0.0', port=1338):
+    port = int(arg)
+    if not 0 <= port <= 65535:
+        raise ValueError('port out of range: {}'.format(port))
+    return port
+
+
+class ControllerInfo(object):
+    """
+    What the game knows about one connected controller.
+    """
+    __slots__ = ('uid', 'addr', 'port', 'states', 'last_seen')
+
+    def __init__(self, uid, addr, port, last_seen):
         """
-        Creates a controller deamon
+        Create a record for a new controller.
 
-        :param host: Bind to address
-        :param port: Bind to port
-        :type host: str
+        :param uid: Unique id of the controller
+        :param addr: Address of the controller
+        :param port: Port that the controller listens on
+        :param last_seen: Time of the last datagram from the controller
+        :type uid: str
+        :type addr: str
         :type port: int
+        :type last_seen: float
         """
-        super(Controller, self).__init__()
-        self.host = host
+        self.uid = uid
+        self.addr = addr
         self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((host, port))
-        self.queue = Queue()
+        self.states = 0
+        self.last_seen = last_seen
+
+
+class BaseController(object):
+    """
+    The controller protocol: keeps track of the connected controllers and turns their datagrams into events. It does
+    no I/O on its own, subclasses feed it datagrams with _handle() and send datagrams for it in _sendto().
+    """
+    def __init__(self, keypressed=True, timeout=60):
+        """
+        :param keypressed: Send E_KEYPRESSED events for every held button with every states update
+        :param timeout: Disconnect controllers that haven't sent anything for this many seconds
+        :type keypressed: bool
+        :type timeout: float
+        """
+        self.queue = EventQueue()
+        # uid -> ControllerInfo and address -> ControllerInfo
         self.controllers = {}
+        self.addresses = {}
+        self.keypressed = keypressed
+        self.timeout = timeout
+        # heap of (deadline, uid), one entry per controller. deadlines may be too early, last_seen tells the truth
+        self._deadlines = []
+        # uid -> (pressed buttons bitmask, last seen), the values only get replaced, never changed
+        self._states = {}
+        # event types and controllers the game wants events for, None means all
+        self._types = None
+        self._uids = None
+        # number of datagrams that could not be parsed
+        self.malformed = 0
+        # while a batch of datagrams is handled its events are collected here
+        self._batch = None
+        self._commands = {b'ping': self._cmd_ping,
+                          b'kthxbye': self._cmd_kthxbye,
+                          b'states': self._cmd_states,
+                          b'text': self._cmd_text}
+
+    def subscribe(self, types=None, uids=None):
+        """
+        Choose which events the game gets. Other events are dropped right away, before an Event is created. Button
+        states, last seen times and the list of controllers are kept up to date anyway.
+
+        :param types: Event types to get, all by default
+        :param uids: Unique ids of the controllers to get events from, all by default
+        :type types: list
+        :type uids: list
+        """
+        self._types = None if types is None else frozenset(types)
+        self._uids = None if uids is None else frozenset(uids)
+
+    def _wants(self, uid, type):
+        """
+        Does the game want this event?
+
+        :param uid: Unique id of the controller
+        :param type: Event type
+        :type uid: str
+        :type type: int
+        :rtype: bool
+        """
+        return (self._types is None or type in self._types) and (self._uids is None or uid in self._uids)
+
+    def _put(self, event):
+        """
+        Hand an event to the game, or to the current batch.
+
+        :param event: The event
+        :type event: Event
+        """
+        if self._batch is None:
+            self.queue.put(event)
+        else:
+            self._batch.append(event)
+
+    def _sendto(self, data, address):
+        """
+        Send a datagram to a controller.
+
+        :param data: The datagram
+        :param address: Address and port of the controller
+        :type data: bytes
+        :type address: tuple
+        :return: Number of bytes send
+        :rtype: int
+        """
+        raise NotImplementedError
 
     def _new_controller(self, addr, port):
         """
@@ -48,27 +181,45 @@ class Controller(Thread):
         :return: Unique id of the controller
         :rtype: str
         """
-        for uid, controller in self.controllers.items():
-            if controller[0] == addr:
-                # duplicate address. sending the uid again
-                #print('/uid/{} => {}:{}'.format(uid, addr, port))
-                self.sock.sendto('/uid/{}'.format(uid).encode('utf-8'), (addr, port))
-                return False
+        controller = self.addresses.get(addr)
+        if controller is not None:
+            # duplicate address. sending the uid again
+            #print('/uid/{} => {}:{}'.format(controller.uid, addr, port))
+            self._sendto('/uid/{}'.format(controller.uid).encode('utf-8'), (addr, port))
+            return False
 
         # get an uid and add the controller to the game
         uid = str(uuid4())
-        self.controllers[uid] = [addr, port, '00000000000000', time.time()]
+        controller = self.controllers[uid] = self.addresses[addr] = ControllerInfo(uid, addr, port, time.time())
+        self._states[uid] = (0, controller.last_seen)
+        heapq.heappush(self._deadlines, (controller.last_seen + self.timeout, uid))
 
         # tell the controller about it
         #print('/uid/{} => {}:{}'.format(uid, addr, port))
-        self.sock.sendto('/uid/{}'.format(uid).encode('utf-8'), (addr, port))
+        self._sendto('/uid/{}'.format(uid).encode('utf-8'), (addr, port))
 
         # create event for pymlgame
-        e = Event(uid, E_NEWCTLR)
-        self.queue.put_nowait(e)
+        if self._wants(uid, E_NEWCTLR):
+            self._put(Event(uid, E_NEWCTLR))
 
         return uid
 
+    def _remove(self, uid):
+        """
+        Remove a controller from the registry.
+
+        :param uid: Unique id of the controller
+        :type uid: str
+        :return: The removed controller or None if there is no such controller
+        :rtype: ControllerInfo
+        """
+        controller = self.controllers.pop(uid, None)
+        if controller is not None:
+            if self.addresses.get(controller.addr) is controller:
+                del self.addresses[controller.addr]
+            self._states.pop(uid, None)
+        return controller
+
     def _del_controller(self, uid):
         """
         Remove controller from internal list and tell the game.
@@ -76,13 +227,8 @@ class Controller(Thread):
         :param uid: Unique id of the controller
         :type uid: str
         """
-        try:
-            self.controllers.pop(uid)
-            e = Event(uid, E_DISCONNECT)
-            self.queue.put_nowait(e)
-        except KeyError:
-            # There is no such controller, ignore the command
-            pass
+        if self._remove(uid) is not None and self._wants(uid, E_DISCONNECT):
+            self._put(Event(uid, E_DISCONNECT))
 
     def _ping(self, uid, addr, port):
         """
@@ -96,46 +242,84 @@ class Controller(Thread):
         :type addr: str
         :type port: int
         """
-        try:
-            self.controllers[uid][0] = addr
-            self.controllers[uid][1] = port
-            self.controllers[uid][3] = time.time()
-
-            e = Event(uid, E_PING)
-            self.queue.put_nowait(e)
-        except KeyError:
+        controller = self.controllers.get(uid)
+        if controller is None:
             # There is no such controller, ignore the command
-            pass
+            return
+        if controller.addr != addr:
+            if self.addresses.get(controller.addr) is controller:
+                del self.addresses[controller.addr]
+            self.addresses[addr] = controller
+            controller.addr = addr
+        controller.port = port
+        controller.last_seen = time.time()
+        self._states[uid] = (controller.states, controller.last_seen)
+
+        if self._wants(uid, E_PING):
+            self._put(Event(uid, E_PING))
 
     def _update_states(self, uid, states):
         """
         Got states of all buttons from a controller. Now check if something changed and create events if neccesary.
 
+        The states are kept as a bitmask with bit n set while button n is pressed, so only the buttons that changed
+        need to be looked at.
+
         :param uid: Unique id of the controller
         :param states: Buttons states
         :type uid: str
         :type states: str
         """
-        #TODO: use try and catch all exceptions
-        # test if uid exists
-        if self.controllers.get(uid, None):
-            # test if states have correct lenght
-            if len(states) == 14:
-                old_states = self.controllers[uid][2]
-                for key in range(14):
-                    old_state = int(old_states[key])
-                    current_state = int(states[key])
-                    if old_state > current_state:
-                        e = Event(uid, E_KEYUP, key)
-                        self.queue.put_nowait(e)
-                    elif old_state < current_state:
-                        e = Event(uid, E_KEYDOWN, key)
-                        self.queue.put_nowait(e)
-                    elif old_state == 1 and current_state == 1:
-                        e = Event(uid, E_KEYPRESSED, key)
-                        self.queue.put_nowait(e)
-                self.controllers[uid][2] = states
-            self.controllers[uid][3] = time.time()
+        # test if states have correct lenght and only zeros and ones
+        if len(states) != 14 or states.strip('01'):
+            return
+        # the first character is button 0, so it has to become the lowest bit
+        self._set_states(uid, int(states[::-1], 2))
+
+    def _set_states(self, uid, current):
+        """
+        Store the new button states of a controller and create events for the buttons that changed.
+
+        :param uid: Unique id of the controller
+        :param current: Bitmask with bit n set while button n is pressed
+        :type uid: str
+        :type current: int
+        """
+        controller = self.controllers.get(uid)
+        if controller is None:
+            return
+        controller.last_seen = now = time.time()
+        old = controller.states
+        controller.states = current
+        self._states[uid] = (current, now)
+        if self._uids is not None and uid not in self._uids:
+            return
+        types = self._types
+        changed = old ^ current
+        keypressed = self.keypressed
+        if types is not None:
+            if E_KEYDOWN not in types:
+                changed &= old
+            if E_KEYUP not in types:
+                changed &= current
+            keypressed = keypressed and E_KEYPRESSED in types
+        events = []
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            events.append(Event(uid, E_KEYDOWN if current & bit else E_KEYUP, bit.bit_length() - 1, now))
+        if keypressed:
+            held = old & current
+            while held:
+                bit = held & -held
+                held ^= bit
+                events.append(Event(uid, E_KEYPRESSED, bit.bit_length() - 1, now))
+        if not events:
+            pass
+        elif self._batch is None:
+            self.queue.put_many(events)
+        else:
+            self._batch.extend(events)
 
     def _got_message(self, uid, text):
         """
@@ -146,11 +330,36 @@ class Controller(Thread):
         :type uid: str
         :type text: str
         """
-        #TODO: use try
-        e = Event(uid, E_MESSAGE, text)
-        self.queue.put_nowait(e)
+        controller = self.controllers.get(uid)
+        if controller is None:
+            return
+        if self._wants(uid, E_MESSAGE):
+            self._put(Event(uid, E_MESSAGE, text))
+
+        controller.last_seen = time.time()
+        self._states[uid] = (controller.states, controller.last_seen)
+
+    def get_states(self):
+        """
+        Get the buttons that are pressed right now on all controllers. Poll this once per frame if you don't want to
+        keep track of the KEYDOWN and KEYUP events yourself. The result is a copy and doesn't change afterwards.
+
+        :return: uid -> (bitmask with bit n set while button n is pressed, time the controller was last seen)
+        :rtype: dict
+        """
+        return self._states.copy()
 
-        self.controllers[uid][2] = time.time()
+    def get_state(self, uid):
+        """
+        Get the buttons that are pressed right now on one controller.
+
+        :param uid: Unique id of the controller
+        :type uid: str
+        :return: Bitmask with bit n set while button n is pressed and the time the controller was last seen or None if
+                 there is no such controller
+        :rtype: tuple
+        """
+        return self._states.get(uid)
 
     def send(self, uid, event, payload=None):
         """
@@ -163,60 +372,204 @@ class Controller(Thread):
         :type uid: str
         :type event: Event
         :type payload: str
-        :return: Number of bytes send or False
+        :return: Number of bytes send or False if there is no such controller, the event can't be send or sending
+                 failed, e.g. because the send buffer is full
         :rtype: int
         """
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        if uid in self.controllers.keys():
-            addr = self.controllers[uid][0]
-            port = self.controllers[uid][1]
-            if event == E_MESSAGE:
-                #print('/message/{} => {}:{}'.format(payload, addr, port))
-                return sock.sendto('/message/{}'.format(payload).encode('utf-8'), (addr, port))
-            elif event == E_RUMBLE:
-                #print('/rumble/{} => {}:{}'.format(payload, addr, port))
-                return sock.sendto('/rumble/{}'.format(payload).encode('utf-8'), (addr, port))
-            else:
-                pass
+        controller = self.controllers.get(uid)
+        prefix = SEND_PREFIXES.get(event)
+        if controller is None or prefix is None:
+            return False
+        #print('{}{} => {}:{}'.format(prefix, payload, controller.addr, controller.port))
+        try:
+            return self._sendto('{}{}'.format(prefix, payload).encode('utf-8'), (controller.addr, controller.port))
+        except (OSError, OverflowError):
+            # e.g. the send buffer is full, the socket is non blocking while the controller thread runs
+            return False
+
+    def broadcast(self, event, payload=None, uids=None):
+        """
+        Send an event to many controllers at once, e.g. let all of them rumble. The datagram is only encoded once.
+
+        :param event: Event type, E_MESSAGE or E_RUMBLE
+        :param payload: Payload of the event
+        :param uids: Unique ids of the controllers, all connected controllers by default
+        :type event: int
+        :type payload: str
+        :type uids: list
+        :return: Number of controllers the event was send to
+        :rtype: int
+        """
+        prefix = SEND_PREFIXES.get(event)
+        if prefix is None:
+            return 0
+        data = '{}{}'.format(prefix, payload).encode('utf-8')
+        # take a copy, the registry may change while we send
+        if uids is None:
+            controllers = list(self.controllers.values())
         else:
-            pass
-        return False
+            controllers = [self.controllers.get(uid) for uid in uids]
+        sendto = self._sendto
+        count = 0
+        for controller in controllers:
+            if controller is None:
+                continue
+            try:
+                sendto(data, (controller.addr, controller.port))
+            except (OSError, OverflowError):
+                # this one can't be reached right now, the others still get it
+                continue
+            count += 1
+        return count
 
-    def run(self):
+    def _cmd_ping(self, uid, addr, arg):
+        # /controller/<uid>/ping/<port>
+        self._ping(uid, addr, _port(arg))
+
+    def _cmd_kthxbye(self, uid, addr, arg):
+        # /controller/<uid>/kthxbye
+        self._del_controller(uid)
+
+    def _cmd_states(self, uid, addr, arg):
+        # /controller/<uid>/states/<states>
+        self._update_states(uid, arg.decode('ascii'))
+
+    def _cmd_text(self, uid, addr, arg):
+        # /controller/<uid>/text/<text>, the text may contain slashes
+        self._got_message(uid, arg.decode('utf-8'))
+
+    def _handle(self, data, addr):
+        """
+        Parse one datagram and do what it says. The datagram is split only once and stays bytes as long as possible.
+
+        :param data: The datagram
+        :param addr: Address of the sender
+        :type data: bytes
+        :type addr: str
+        :return: Was the datagram understood?
+        :rtype: bool
+        """
+        # b'/controller/<uid>/<cmd>/<arg>' -> [b'', b'controller', uid, cmd, arg]
+        parts = data.split(b'/', 4)
+        if len(parts) < 4 or parts[1] != b'controller' or parts[0]:
+            self.malformed += 1
+            return False
+        try:
+            if parts[2] == b'new':
+                # /controller/new/<port>
+                self._new_controller(addr, _port(parts[3]))
+            else:
+                command = self._commands.get(parts[3])
+                if command is None:
+                    self.malformed += 1
+                    return False
+                command(parts[2].decode('ascii'), addr, parts[4] if len(parts) > 4 else b'')
+        except (ValueError, OverflowError, UnicodeDecodeError, OSError):
+            # bad port, states or encoding or the controller can't be reached
+            self.malformed += 1
+            return False
+        return True
+
+    def _handle_batch(self, datagrams):
+        """
+        Parse several datagrams and give all their events to the game at once.
+
+        :param datagrams: (data, (address, port)) for every datagram
+        :type datagrams: list
+        """
+        self._batch = batch = []
+        try:
+            for data, sender in datagrams:
+                self._handle(data, sender[0])
+        finally:
+            self._batch = None
+        if batch:
+            self.queue.put_many(batch)
+
+    def _expire(self, now=None):
+        """
+        Find unused controllers, delete them and tell the game. Only the controllers whose deadline has passed are
+        looked at. If one was seen in the meantime it just gets a new deadline.
+
+        :param now: Current time
+        :type now: float
         """
-        Listen for controllers.
-        """
-        while True:
-            data, sender = self.sock.recvfrom(1024)
-            addr = sender[0]
-            msg = data.decode('utf-8')
-            if msg.startswith('/controller/'):
-                try:
-                    uid = msg.split('/')[2]
-                    if uid == 'new':
-                        port = int(msg.split('/')[3])
-                        self._new_controller(addr, port)
-                    else:
-                        cmd = msg.split('/')[3]
-                        if cmd == 'ping':
-                            port = msg.split('/')[3]
-                            self._ping(uid, addr, port)
-                        elif cmd == 'kthxbye':
-                            self._del_controller(uid)
-                        elif cmd == 'states':
-                            states = msg.split('/')[4]
-                            self._update_states(uid, states)
-                        elif cmd == 'text':
-                            # /controller/<uid>/text/<text>
-                            text = msg[12 + len(uid) + 6:]
-                            self._got_message(uid, text)
-                except IndexError or KeyError:
-                    pass
+        if now is None:
+            now = time.time()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            uid = heapq.heappop(deadlines)[1]
+            controller = self.controllers.get(uid)
+            if controller is None:
+                # already gone
+                continue
+            deadline = controller.last_seen + self.timeout
+            if deadline <= now:
+                self._del_controller(uid)
             else:
-                pass
+                heapq.heappush(deadlines, (deadline, uid))
+
+
+class Controller(BaseController, Thread):
+    """
+    A controller can be a game controller attached to the system or any other input that can trigger the controller
+    functions like a smartphone app.
+    """
+    def __init__(self, host='0.0.0.0', port=1338, keypressed=True, timeout=60, rcvbuf=None, batch_size=256):
+        """
+        Creates a controller deamon
+
+        :param host: Bind to address
+        :param port: Bind to port
+        :param keypressed: Send E_KEYPRESSED events for every held button with every states update
+        :param timeout: Disconnect controllers that haven't sent anything for this many seconds
+        :param rcvbuf: Size of the receive buffer of the socket in bytes, the system default if None. Make it bigger if
+                       datagrams get lost when many controllers send at once
+        :param batch_size: Maximum number of datagrams that are read and handled in one go
+        :type host: str
+        :type port: int
+        :type keypressed: bool
+        :type timeout: float
+        :type rcvbuf: int
+        :type batch_size: int
+        """
+        BaseController.__init__(self, keypressed, timeout)
+        Thread.__init__(self)
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.running = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.bind((host, port))
+
+    def _sendto(self, data, address):
+        return self.sock.sendto(data, address)
+
+    def stop(self):
+        """
+        Let the thread end, it takes up to a second to notice.
+        """
+        self.running = False
+
+    def run(self):
+        """
+        Listen for controllers. The thread wakes up when datagrams come in and handles all of them at once.
+        """
+        # wake up at least once a second to disconnect unused controllers, even if nothing comes in
+        interval = min(1.0, self.timeout)
+        self.sock.setblocking(False)
+        next_expiry = time.time() + interval
+        self.running = True
+        while self.running:
+            readable = select.select([self.sock], [], [], max(next_expiry - time.time(), 0))[0]
+            if readable:
+                datagrams = receive(self.sock, self.batch_size)
+                if datagrams:
+                    self._handle_batch(datagrams)
 
-            # find unused controllers and delete them
-            ctlrs = self.controllers.items()
-            for uid, state in ctlrs:
-                if state[3] < time.time() - 60:
-                    self.controllers.pop(uid)
+            now = time.time()
+            if now >= next_expiry:
+                self._expire(now)
+                next_expiry = now + interval
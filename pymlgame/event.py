@@ -4,14 +4,151 @@
 PyMLGame - Event
 """
 
+import time
+from array import array
+from threading import Lock
+
 from pymlgame.locals import E_KEYDOWN, E_KEYUP, E_KEYPRESSED
 
+KEY_EVENTS = frozenset([E_KEYDOWN, E_KEYUP, E_KEYPRESSED])
+
+_now = time.time
+
 
 class Event(object):
-    def __init__(self, uid, type, data=None):
+    """
+    Something happened on a controller. Every event has the same attributes: uid, type, button (the button of key
+    events, None otherwise), data (the payload of the event) and time (when the event came in).
+    """
+    __slots__ = ('uid', 'type', 'button', 'data', 'time')
+
+    def __init__(self, uid, type, data=None, time=None):
+        """
+        Create an event.
+
+        :param uid: Unique id of the controller
+        :param type: Event type
+        :param data: Button for key events, payload for everything else
+        :param time: Time the event came in, now by default
+        :type uid: str
+        :type type: int
+        :type time: float
+        """
         self.uid = uid
         self.type = type
-        if type in [E_KEYDOWN, E_KEYUP, E_KEYPRESSED]:
-            self.button = data
-        else:
-            self.data = data
+        self.button = data if type in KEY_EVENTS else None
+        self.data = data
+        self.time = _now() if time is None else time
+
+    def __repr__(self):
+        return 'Event({!r}, {}, {!r})'.format(self.uid, self.type, self.data)
+
+
+class EventBatch(object):
+    """
+    A list of events stored as parallel arrays, one entry per event. Buttons are -1 for events that are no key events.
+    """
+    __slots__ = ('uids', 'types', 'buttons', 'data', 'times')
+
+    def __init__(self, events=()):
+        """
+        Create a batch.
+
+        :param events: The events
+        :type events: list
+        """
+        self.uids = [e.uid for e in events]
+        self.types = array('B', [e.type for e in events])
+        self.buttons = array('b', [-1 if e.button is None else e.button for e in events])
+        self.data = [e.data for e in events]
+        self.times = array('d', [e.time for e in events])
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __getitem__(self, index):
+        return Event(self.uids[index], self.types[index], self.data[index], self.times[index])
+
+
+class EventQueue(object):
+    """
+    Hands events from the controller thread to the game. Both sides take the lock once per call, no matter how many
+    events they put in or take out.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._events = []
+
+    def __len__(self):
+        return len(self._events)
+
+    def empty(self):
+        """
+        Are there no events waiting?
+
+        :rtype: bool
+        """
+        return not self._events
+
+    def put(self, event):
+        """
+        Add one event.
+
+        :param event: The event
+        :type event: Event
+        """
+        with self._lock:
+            self._events.append(event)
+
+    def put_many(self, events):
+        """
+        Add several events at once.
+
+        :param events: The events
+        :type events: list
+        """
+        with self._lock:
+            self._events.extend(events)
+
+    def drain(self, maximum=None):
+        """
+        Take out all waiting events, or the oldest ones up to a maximum.
+
+        :param maximum: Maximum number of events
+        :type maximum: int
+        :return: The events in the order they came in
+        :rtype: list
+        """
+        with self._lock:
+            if maximum is None or maximum >= len(self._events):
+                events = self._events
+                self._events = []
+            else:
+                events = self._events[:maximum]
+                del self._events[:maximum]
+        return events
+
+    def drain_batch(self, maximum=None):
+        """
+        Like drain(), but the events come as parallel arrays.
+
+        :param maximum: Maximum number of events
+        :type maximum: int
+        :return: The events
+        :rtype: EventBatch
+        """
+        return EventBatch(self.drain(maximum))
+
+    def get_nowait(self):
+        """
+        Take out the oldest event.
+
+        :return: The event or None if there is none
+        :rtype: Event
+        """
+        with self._lock:
+            if self._events:
+                return self._events.pop(0)
+        return None
+
+    put_nowait = put
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+PyMLGame - Font
+"""
+
+from collections import OrderedDict
+
+from pymlgame.locals import BLACK
+from pymlgame.surface import Surface
+
+# the 5x5 font from font.png, one bitmask per row with the leftmost pixel in the highest bit
+DEFAULT_GLYPHS = {
+    'A': (0b11111, 0b10001, 0b11111, 0b10001, 0b10001),
+    'B': (0b11110, 0b10001, 0b11110, 0b10001, 0b11110),
+    'C': (0b01111, 0b10000, 0b10000, 0b10000, 0b01111),
+    'D': (0b11110, 0b10001, 0b10001, 0b10001, 0b11110),
+    'E': (0b11111, 0b10000, 0b11110, 0b10000, 0b11111),
+    'F': (0b11111, 0b10000, 0b11110, 0b10000, 0b10000),
+    'G': (0b01110, 0b10000, 0b10111, 0b10001, 0b01110),
+    'H': (0b10001, 0b10001, 0b11111, 0b10001, 0b10001),
+    'I': (0b11111, 0b00100, 0b00100, 0b00100, 0b11111),
+    'J': (0b11111, 0b00001, 0b00001, 0b10001, 0b11110),
+    'K': (0b10001, 0b10010, 0b11100, 0b10010, 0b10001),
+    'L': (0b10000, 0b10000, 0b10000, 0b10000, 0b11111),
+    'M': (0b11111, 0b10101, 0b10101, 0b10101, 0b10101),
+    'N': (0b10001, 0b11001, 0b10101, 0b10011, 0b10001),
+    'O': (0b01110, 0b10001, 0b10001, 0b10001, 0b01110),
+    'P': (0b11110, 0b10001, 0b11110, 0b10000, 0b10000),
+    'Q': (0b01110, 0b10001, 0b10101, 0b10011, 0b01111),
+    'R': (0b11110, 0b10001, 0b11110, 0b10001, 0b10001),
+    'S': (0b01111, 0b10000, 0b01110, 0b00001, 0b11110),
+    'T': (0b11111, 0b00100, 0b00100, 0b00100, 0b00100),
+    'U': (0b10001, 0b10001, 0b10001, 0b10001, 0b01110),
+    'V': (0b10001, 0b10001, 0b01010, 0b01010, 0b00100),
+    'W': (0b10101, 0b10101, 0b10101, 0b10101, 0b01010),
+    'X': (0b10001, 0b01010, 0b00100, 0b01010, 0b10001),
+    'Y': (0b10001, 0b01010, 0b00100, 0b00100, 0b00100),
+    'Z': (0b11111, 0b00010, 0b00100, 0b01000, 0b11111),
+    '0': (0b01110, 0b10001, 0b10101, 0b10001, 0b01110),
+    '1': (0b00100, 0b00100, 0b00100, 0b00100, 0b00100),
+    '2': (0b11111, 0b00001, 0b11111, 0b10000, 0b11111),
+    '3': (0b11111, 0b00001, 0b11111, 0b00001, 0b11111),
+    '4': (0b10001, 0b10001, 0b11111, 0b00001, 0b00001),
+    '5': (0b11111, 0b10000, 0b11110, 0b00001, 0b11110),
+    '6': (0b01110, 0b10000, 0b11110, 0b10001, 0b01110),
+    '7': (0b11111, 0b00001, 0b00001, 0b00001, 0b00001),
+    '8': (0b01110, 0b10001, 0b01110, 0b10001, 0b01110),
+    '9': (0b01110, 0b10001, 0b01111, 0b00001, 0b01111),
+    '!': (0b00100, 0b00100, 0b00100, 0b00000, 0b00100),
+    '?': (0b01110, 0b00001, 0b00110, 0b00000, 0b00100),
+    '#': (0b01010, 0b11111, 0b01010, 0b11111, 0b01010),
+    ' ': (0b00000, 0b00000, 0b00000, 0b00000, 0b00000),
+    '(': (0b00010, 0b00100, 0b00100, 0b00100, 0b00010),
+    ')': (0b01000, 0b00100, 0b00100, 0b00100, 0b01000),
+    '[': (0b00110, 0b00100, 0b00100, 0b00100, 0b00110),
+    ']': (0b01100, 0b00100, 0b00100, 0b00100, 0b01100),
+    '.': (0b00000, 0b00000, 0b00000, 0b00000, 0b00100),
+    ',': (0b00000, 0b00000, 0b00000, 0b00010, 0b00100),
+    '-': (0b00000, 0b00000, 0b01110, 0b00000, 0b00000),
+    '_': (0b00000, 0b00000, 0b00000, 0b00000, 0b11111),
+    ':': (0b00000, 0b00100, 0b00000, 0b00100, 0b00000),
+    ';': (0b00000, 0b00010, 0b00000, 0b00010, 0b00100),
+    '+': (0b00000, 0b00100, 0b01110, 0b00100, 0b00000),
+    '=': (0b00000, 0b01110, 0b00000, 0b01110, 0b00000),
+}
+
+
+class Font(object):
+    """
+    A bitmap font. Every glyph is stored as a bitmask per row and turned into spans once, so drawing text only writes
+    whole spans. Rendered strings are kept in a small LRU cache.
+    """
+    def __init__(self, glyphs=None, width=5, height=5, spacing=1, cache_size=32):
+        """
+        Create a font. Without glyphs the built in 5x5 font is used.
+
+        :param glyphs: Character => tuple of row bitmasks, the leftmost pixel is the highest bit
+        :param width: Width of a glyph
+        :param height: Height of a glyph
+        :param spacing: Space between two glyphs
+        :param cache_size: Number of rendered strings to keep
+        :type glyphs: dict
+        :type width: int
+        :type height: int
+        :type spacing: int
+        :type cache_size: int
+        """
+        if glyphs is None:
+            glyphs = DEFAULT_GLYPHS
+        self.width = width
+        self.height = height
+        self.spacing = spacing
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # character => list of (row, start, end)
+        self._spans = {}
+        for char, rows in glyphs.items():
+            spans = []
+            for y, mask in enumerate(rows):
+                start = None
+                for x in range(width + 1):
+                    bit = x < width and mask >> (width - 1 - x) & 1
+                    if bit and start is None:
+                        start = x
+                    elif not bit and start is not None:
+                        spans.append((y, start, x))
+                        start = None
+            self._spans[char] = spans
+
+    @classmethod
+    def from_surface(cls, surface, chars, width, height, color=BLACK, spacing=1, cache_size=32):
+        """
+        Create a font from a surface with all glyphs next to each other, from left to right and top to bottom.
+
+        :param surface: Surface with the glyphs
+        :param chars: The characters in the order they are on the surface
+        :param width: Width of a glyph
+        :param height: Height of a glyph
+        :param color: Color of the glyph pixels on the surface
+        :param spacing: Space between two glyphs
+        :param cache_size: Number of rendered strings to keep
+        :type surface: Surface
+        :type chars: str
+        :type width: int
+        :type height: int
+        :type color: tuple
+        :type spacing: int
+        :type cache_size: int
+        :return: The font
+        :rtype: Font
+        """
+        color = tuple(color)
+        per_row = surface.width // width
+        glyphs = {}
+        for n, char in enumerate(chars):
+            left = n % per_row * width
+            top = n // per_row * height
+            rows = []
+            for y in range(top, top + height):
+                mask = 0
+                for x in range(left, left + width):
+                    mask = mask << 1 | (surface.matrix[x][y] == color)
+                rows.append(mask)
+            glyphs[char] = tuple(rows)
+        return cls(glyphs, width, height, spacing, cache_size)
+
+    def _glyph(self, char):
+        """
+        Get the spans of a character. Lowercase characters fall back to uppercase, unknown ones are blank.
+
+        :param char: The character
+        :type char: str
+        :return: List of (row, start, end)
+        :rtype: list
+        """
+        spans = self._spans.get(char)
+        if spans is None:
+            spans = self._spans.get(char.upper(), [])
+        return spans
+
+    def size(self, text):
+        """
+        Get the size of a text.
+
+        :param text: The text
+        :type text: str
+        :return: Width and height
+        :rtype: tuple
+        """
+        if not text:
+            return 0, self.height
+        return len(text) * (self.width + self.spacing) - self.spacing, self.height
+
+    def draw(self, surface, pos, text, color):
+        """
+        Draw a text on a surface. Only the glyph pixels are drawn, the background stays as it is.
+
+        :param surface: Surface to draw on
+        :param pos: Top left corner of the text
+        :param text: The text
+        :param color: Color of the text
+        :type surface: Surface
+        :type pos: tuple
+        :type text: str
+        :type color: tuple
+        """
+        x = int(pos[0])
+        y = int(pos[1])
+        color = surface._encode(color)
+        advance = self.width + self.spacing
+        for n, char in enumerate(text):
+            left = x + n * advance
+            if left >= surface.width:
+                break
+            if left + self.width <= 0:
+                continue
+            for row, start, end in self._glyph(char):
+                surface._hline(left + start, y + row, end - start, color)
+        surface.mark_dirty(y, self.height)
+
+    def render(self, text, color, background=BLACK):
+        """
+        Render a text on a new surface that fits it exactly. The result is cached, so don't draw on it.
+
+        :param text: The text
+        :param color: Color of the text
+        :param background: Color of the background
+        :type text: str
+        :type color: tuple
+        :type background: tuple
+        :return: Surface with the text
+        :rtype: Surface
+        """
+        key = (text, tuple(color), tuple(background))
+        surface = self._cache.get(key)
+        if surface is not None:
+            self._cache.move_to_end(key)
+            return surface
+
+        width, height = self.size(text)
+        surface = Surface(max(width, 1), height)
+        surface.fill(background)
+        self.draw(surface, (0, 0), text, color)
+        self._cache[key] = surface
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return surface
+
+
+class Marquee(object):
+    """
+    A text that scrolls from right to left through a window. The text is rendered once into a strip and every frame
+    just blits the visible part of the strip.
+    """
+    def __init__(self, font, text, color, width, background=BLACK, gap=None):
+        """
+        Create a marquee.
+
+        :param font: Font for the text
+        :param text: The text
+        :param color: Color of the text
+        :param width: Width of the window
+        :param background: Color of the background
+        :param gap: Empty pixels between the end of the text and its next start, the window width by default
+        :type font: Font
+        :type text: str
+        :type color: tuple
+        :type width: int
+        :type background: tuple
+        :type gap: int
+        """
+        self.width = width
+        self.height = font.height
+        self.offset = 0
+        if gap is None:
+            gap = width
+        rendered = font.render(text, color, background)
+        self.period = rendered.width + gap
+        # the strip holds the text twice, so every window position is one blit
+        self.strip = Surface(self.period + width, self.height)
+        self.strip.fill(background)
+        for left in range(0, self.strip.width, self.period):
+            self.strip.blit(rendered, (left, 0))
+
+    def scroll(self, step=1):
+        """
+        Move the text to the left.
+
+        :param step: Pixels to move
+        :type step: int
+        """
+        self.offset = (self.offset + step) % self.period
+
+    def draw(self, surface, pos):
+        """
+        Draw the current window of the text on a surface.
+
+        :param surface: Surface to draw on
+        :param pos: Top left corner of the window
+        :type surface: Surface
+        :type pos: tuple
+        """
+        surface.blit(self.strip, pos, (self.offset, 0, self.width, self.height))
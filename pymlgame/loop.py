@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+PyMLGame - Loop
+"""
+
+import time
+try:
+    from inspect import isawaitable
+except ImportError:
+    # no coroutines before python 3.5, so nothing can be awaited
+    def isawaitable(obj):
+        return False
+
+from pymlgame.profiler import PROFILER
+
+
+class GameLoop(object):
+    """
+    Runs the game logic at a fixed tick rate and renders at its own, usually lower, rate. The speed of the game
+    doesn't depend on how fast rendering is. If the game falls behind, frames are skipped instead of slowing down the
+    simulation.
+    """
+    def __init__(self, update, render, handle_events=None, tick_rate=30, render_rate=None, max_frame_skip=5):
+        """
+        Create a game loop.
+
+        :param update: Called once per tick to advance the game
+        :param render: Called once per frame with the interpolation alpha (0 <= alpha <= 1) between the last and the
+                       next tick
+        :param handle_events: Called once per tick before update
+        :param tick_rate: Ticks per second
+        :param render_rate: Frames per second, the tick rate by default
+        :param max_frame_skip: Render at least every this many frames, even if the game is behind. If the game can't
+                               keep up at all, it runs at most this many ticks between two renders and slows down
+        :type update: callable
+        :type render: callable
+        :type handle_events: callable
+        :type tick_rate: float
+        :type render_rate: float
+        :type max_frame_skip: int
+        """
+        self.update = update
+        self.render = render
+        self.handle_events = handle_events
+        self.tick_rate = tick_rate
+        self.render_rate = render_rate or tick_rate
+        self.max_frame_skip = max_frame_skip
+        self.ticks = 0
+        self.frames = 0
+        self.skipped_frames = 0
+        self.alpha = 0.0
+        self.running = False
+
+    def stop(self):
+        """
+        Let the loop end after the current iteration.
+        """
+        self.running = False
+
+    def run(self):
+        """
+        Run the loop until stop() gets called or the game gets interrupted. If the profiler is enabled, the callbacks
+        get timed as the phases handle_events, update and render.
+        """
+        try:
+            for wait in self._steps():
+                if wait > 0:
+                    time.sleep(wait)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.running = False
+
+    def _steps(self):
+        """
+        The loop itself. Yields how long to wait before it can go on, or what a callback returned if that has to be
+        awaited. run() and pymlgame.aio.run_game_loop() drive it.
+        """
+        handle_events = self.handle_events and PROFILER.wrap('handle_events', self.handle_events)
+        update = PROFILER.wrap('update', self.update)
+        render = PROFILER.wrap('render', self.render)
+        tick_time = 1.0 / self.tick_rate
+        frame_time = 1.0 / self.render_rate
+        max_ticks = max(self.max_frame_skip, 1)
+        accumulator = 0.0
+        skipped = 0
+        last = time.perf_counter()
+        next_frame = last
+        self.running = True
+        while self.running:
+            now = time.perf_counter()
+            accumulator += now - last
+            last = now
+
+            ticks = 0
+            while accumulator >= tick_time and self.running and ticks < max_ticks:
+                if handle_events:
+                    result = handle_events()
+                    if isawaitable(result):
+                        yield result
+                result = update()
+                if isawaitable(result):
+                    yield result
+                self.ticks += 1
+                ticks += 1
+                accumulator -= tick_time
+            if not self.running:
+                break
+            # if updates take longer than a tick, the game can't catch up. drop the time instead of falling further
+            # behind with every pass, and skipping frames doesn't help either then
+            hopeless = accumulator > max_ticks * tick_time
+            if hopeless:
+                accumulator = max_ticks * tick_time
+
+            now = time.perf_counter()
+            if now >= next_frame:
+                behind = not hopeless and accumulator + now - last >= tick_time
+                if behind and skipped < self.max_frame_skip:
+                    # the next tick is due already, catch up first
+                    skipped += 1
+                    self.skipped_frames += 1
+                else:
+                    skipped = 0
+                    self.alpha = min(accumulator / tick_time, 1.0)
+                    result = render(self.alpha)
+                    if isawaitable(result):
+                        yield result
+                    self.frames += 1
+                next_frame += frame_time
+                if next_frame < now:
+                    next_frame = now + frame_time
+
+            # wait until there is something to do
+            next_tick = last + tick_time - accumulator
+            yield max(min(next_tick, next_frame) - time.perf_counter(), 0.0)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+PyMLGame - Profiler
+"""
+
+import sys
+import time
+from functools import wraps
+
+from pymlgame.surface import Surface
+from pymlgame.screen import Screen
+from pymlgame.sprite import Sprite
+from pymlgame.font import Font
+
+# methods that get timed, (owner, attribute, phase)
+TIMED = [(Screen, 'update', 'screen.update'),
+         (Screen, 'serialize', 'screen.serialize'),
+         (Screen, 'blit', 'screen.blit')]
+# methods that get counted, (owner, attribute)
+COUNTED = [(Surface, 'fill'),
+           (Surface, 'fill_rect'),
+           (Surface, 'draw_dot'),
+           (Surface, 'draw_line'),
+           (Surface, 'draw_lines'),
+           (Surface, 'draw_rect'),
+           (Surface, 'draw_circle'),
+           (Surface, 'draw_ellipse'),
+           (Surface, 'blit'),
+           (Surface, 'replace_color'),
+           (Sprite, 'draw'),
+           (Font, 'draw')]
+
+
+class _Ring(object):
+    """
+    Fixed size ring buffer for timings.
+    """
+    __slots__ = ('values', 'index', 'count')
+
+    def __init__(self, size):
+        self.values = [0.0] * size
+        self.index = 0
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        self.count += 1
+
+    def samples(self):
+        return self.values[:min(self.count, len(self.values))]
+
+
+class _Phase(object):
+    """
+    Context manager that times one phase.
+    """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullPhase(object):
+    """
+    Context manager that does nothing, used while the profiler is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Profiler(object):
+    """
+    Records how long the phases of a frame take and how often the drawing primitives get called.
+
+    While it's disabled nothing is measured and the library code runs unchanged. Enabling it wraps the hot methods
+    (Screen.update, Screen.serialize, Screen.blit, pymlgame.get_events and the drawing methods) with instrumented
+    versions, disabling it puts the originals back. Game code can time its own phases with phase().
+    """
+    def __init__(self, size=512):
+        """
+        Create a profiler.
+
+        :param size: Number of timings to keep per phase
+        :type size: int
+        """
+        self.size = size
+        self.enabled = False
+        self.timings = {}
+        self.counts = {}
+        self._originals = []
+        self._last_dump = time.perf_counter()
+
+    def enable(self):
+        """
+        Start measuring.
+        """
+        if self.enabled:
+            return
+        import pymlgame
+        for owner, attribute, name in TIMED + [(pymlgame, 'get_events', 'events')]:
+            original = getattr(owner, attribute)
+            self._originals.append((owner, attribute, original))
+            setattr(owner, attribute, self._timed(name, original))
+        for owner, attribute in COUNTED:
+            original = owner.__dict__[attribute]
+            self._originals.append((owner, attribute, original))
+            setattr(owner, attribute, self._counted('{}.{}'.format(owner.__name__, attribute), original))
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop measuring and remove the instrumentation. The recorded data stays.
+        """
+        while self._originals:
+            owner, attribute, original = self._originals.pop()
+            setattr(owner, attribute, original)
+        self.enabled = False
+
+    def reset(self):
+        """
+        Throw away all recorded data.
+        """
+        self.timings = {}
+        self.counts = {}
+
+    def _timed(self, name, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def _counted(self, name, func):
+        @wraps(func)
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return counted
+
+    def phase(self, name):
+        """
+        Time a phase of your game, use it like `with profiler.phase('update'):`.
+
+        :param name: Name of the phase
+        :type name: str
+        :return: Context manager
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def wrap(self, name, func):
+        """
+        Get a version of func that gets timed as phase name, or func itself if the profiler is disabled.
+
+        :param name: Name of the phase
+        :param func: Function to time
+        :type name: str
+        :type func: callable
+        :return: The function
+        :rtype: callable
+        """
+        if not self.enabled:
+            return func
+        return self._timed(name, func)
+
+    def record(self, name, seconds):
+        """
+        Record one timing of a phase.
+
+        :param name: Name of the phase
+        :param seconds: Duration
+        :type name: str
+        :type seconds: float
+        """
+        ring = self.timings.get(name)
+        if ring is None:
+            ring = self.timings[name] = _Ring(self.size)
+        ring.add(seconds)
+
+    def stats(self, name):
+        """
+        Get statistics about the recent timings of a phase.
+
+        :param name: Name of the phase
+        :type name: str
+        :return: count, p50, p99 and max in seconds
+        :rtype: dict
+        """
+        ring = self.timings.get(name)
+        samples = sorted(ring.samples()) if ring else []
+        if not samples:
+            return {'count': 0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))]
+        return {'count': ring.count, 'p50': percentile(50), 'p99': percentile(99), 'max': samples[-1]}
+
+    def summary(self):
+        """
+        Get a printable summary of all phases and counts.
+
+        :return: Summary
+        :rtype: str
+        """
+        lines = ['{:<24} {:>8} {:>10} {:>10} {:>10}'.format('phase', 'count', 'p50 ms', 'p99 ms', 'max ms')]
+        for name in sorted(self.timings):
+            stats = self.stats(name)
+            lines.append('{:<24} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(name, stats['count'], stats['p50'] * 1000,
+                                                                         stats['p99'] * 1000, stats['max'] * 1000))
+        for name in sorted(self.counts):
+            lines.append('{:<24} {:>8}'.format(name, self.counts[name]))
+        return '\n'.join(lines)
+
+    def dump(self, interval=5.0, file=None):
+        """
+        Print the summary, but only if the last one is at least interval seconds old. Call it once per frame.
+
+        :param interval: Seconds between two summaries
+        :param file: Where to print to, stderr by default
+        :type interval: float
+        :type file: file
+        :return: Was something printed?
+        :rtype: bool
+        """
+        if not self.enabled:
+            return False
+        now = time.perf_counter()
+        if now - self._last_dump < interval:
+            return False
+        self._last_dump = now
+        print(self.summary(), file=file or sys.stderr)
+        return True
+
+
+PROFILER = Profiler()
@@ -4,66 +4,167 @@
 PyMLGame - Screen
 """
 
+import time
 import socket
+from weakref import WeakKeyDictionary
 
 from pymlgame.locals import BLACK
 from pymlgame.surface import Surface
 
 
-class Screen(object):
+class Screen(Surface):
     """
     Represents the Mate Light screen and has all the drawing methods.
     """
-    def __init__(self, host='127.0.0.1', port=1337, width=40, height=16):
+    def __init__(self, host='127.0.0.1', port=1337, width=40, height=16, skip_duplicates=False, keepalive=1.0,
+                 palette=None):
         """
         Create a screen with default size and fill it with black pixels.
+
+        :param host: Address of Mate Light
+        :param port: Port of Mate Light
+        :param width: Width of the screen
+        :param height: Height of the screen
+        :param skip_duplicates: Don't send a frame again if it didn't change
+        :param keepalive: Seconds after which an unchanged frame is send anyway
+        :param palette: List of colors to make this an indexed screen, see Surface
+        :type host: str
+        :type port: int
+        :type width: int
+        :type height: int
+        :type skip_duplicates: bool
+        :type keepalive: float
+        :type palette: list
         """
         self.host = host
         self.port = port
-        self.width = width
-        self.height = height
+        self.skip_duplicates = skip_duplicates
+        self.keepalive = keepalive
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        super(Screen, self).__init__(width, height, palette)
 
-        self.matrix = None
-        self.reset()
+        # one frame is width * height * 3 (rgb) + 4 (checksum), the buffer and the socket get reused for every frame
+        self._frame = bytearray(width * height * 3 + 4)
+        self._frame_view = memoryview(self._frame)
+        # version of the screen that is in the frame buffer
+        self._encoded = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # copy of the last frame that was send and when
+        self._sent_frame = None
+        self._sent_time = 0
+        # surface => (version of the surface, position, version of the screen) of the last blit
+        self._blits = WeakKeyDictionary()
 
     def reset(self):
         """
         Fill the screen with black pixels
         """
-        surface = Surface(self.width, self.height)
-        surface.fill(BLACK)
-        self.matrix = surface.matrix
+        self.fill(BLACK)
+
+    def blit(self, surface, pos=(0, 0), area=None):
+        """
+        Blits a surface on the screen at pos. This is skipped if neither the surface nor the part of the screen it
+        covers changed since the last time it was blitted there.
+
+        :param surface: Surface to blit
+        :param pos: Top left corner to start blitting
+        :param area: Only blit this part (x, y, width, height) of the surface
+        :type surface: Surface
+        :type pos: tuple
+        :type area: tuple
+        """
+        where = (tuple(pos), area and tuple(area))
+        last = self._blits.get(surface)
+        if last and last[0] == surface.version and last[1] == where:
+            top = max(pos[1], 0)
+            bottom = min(pos[1] + (area[3] if area else surface.height), self.height)
+            if all(version <= last[2] for version in self._row_versions[top:bottom]):
+                return
+        super(Screen, self).blit(surface, pos, area)
+        self._blits[surface] = (surface.version, where, self.version)
+
+    def serialize(self):
+        """
+        Write the current screen contents into the frame buffer. Only the rows that changed since the last call get
+        copied.
+
+        :return: The frame as it gets send to Mate Light
+        :rtype: memoryview
+        """
+        # the pixel buffer already is in the row major order Mate Light wants, the checksum stays zero
+        pixels = memoryview(self.pixels)
+        row = self.width * 3
+        if self.palette is None:
+            for top, bottom in self.dirty_rows(self._encoded):
+                self._frame_view[top * row:bottom * row] = pixels[top * row:bottom * row]
+        else:
+            # indexed pixels only become rgb here
+            tables = None
+            for top, bottom in self.dirty_rows(self._encoded):
+                if tables is None:
+                    tables = self.lookup_tables()
+                indices = pixels[top * self.width:bottom * self.width]
+                self._frame_view[top * row:bottom * row] = self.to_rgb(indices, tables)
+        pixels.release()
+        self._encoded = self.version
+        return self._frame_view
+
+    def _next_frame(self, now):
+        """
+        Serialize the screen and check if the frame has to be send.
+
+        :param now: Current time
+        :type now: float
+        :return: The frame or None if it's a duplicate
+        :rtype: memoryview
+        """
+        frame = self.serialize()
+        if self.skip_duplicates:
+            if self._sent_frame == self._frame and now - self._sent_time < self.keepalive:
+                self.frames_suppressed += 1
+                return None
+            if self._sent_frame is None:
+                self._sent_frame = bytearray(self._frame)
+            else:
+                self._sent_frame[:] = self._frame
+        return frame
 
     def update(self):
         """
-        Sends the current screen contents to Mate Light
+        Sends the current screen contents to Mate Light. With skip_duplicates the frame is only send if it differs from
+        the last one or if the last one is older than keepalive seconds.
+
+        :return: Was the frame send?
+        :rtype: bool
         """
-        display_data = []
-        for y in range(self.height):
-            for x in range(self.width):
-                for color in self.matrix[x][y]:
-                    display_data.append(int(color))
+        return self._send(self.sock.sendto, (self.host, self.port))
 
-        checksum = bytearray([0, 0, 0, 0])
-        data_as_bytes = bytearray(display_data)
-        data = data_as_bytes + checksum
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.sendto(data, (self.host, self.port))
+    def _send(self, sendto, address):
+        """
+        Send the next frame, unless it's a duplicate.
 
-    def blit(self, surface, pos=(0, 0)):
+        :param sendto: Function that sends a datagram, like socket.sendto
+        :param address: Address and port of Mate Light
+        :type sendto: callable
+        :type address: tuple
+        :return: Was the frame send?
+        :rtype: bool
         """
-        Blits a surface on the screen at pos
+        now = time.monotonic()
+        frame = self._next_frame(now)
+        if frame is None:
+            return False
+        sendto(frame, address)
+        self._sent_time = now
+        self.frames_sent += 1
+        return True
 
-        :param surface: Surface to blit
-        :param pos: Top left corner to start blitting
-        :type surface: Surface
-        :type pos: tuple
+    def close(self):
+        """
+        Close the socket to Mate Light.
         """
-        for x in range(surface.width):
-            for y in range(surface.height):
-                point = (x + pos[0], y + pos[1])
-                if self.point_on_screen(point):
-                    self.matrix[point[0]][point[1]] = surface.matrix[x][y]
+        self.sock.close()
 
     def point_on_screen(self, pos):
         """
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+PyMLGame - Sharded Controller
+"""
+
+import os
+import time
+import select
+import socket
+import multiprocessing
+from multiprocessing.connection import wait
+from threading import Thread
+
+from pymlgame.controller import BaseController, receive
+
+# what a receiver process tells the game process, records are (command, uid, address, value)
+NEW = 0
+PING = 1
+BYE = 2
+STATES = 3
+TEXT = 4
+MALFORMED = 5
+
+
+class _Shard(BaseController):
+    """
+    Runs in a receiver process. Parses datagrams like a Controller, but instead of changing the registry it collects
+    records of what the datagrams mean for the game process.
+    """
+    def __init__(self, keypressed, refresh=1.0):
+        """
+        :param keypressed: The game wants E_KEYPRESSED events, so every states update has to be forwarded
+        :param refresh: Forward unchanged states at least this often so the controller doesn't time out
+        :type keypressed: bool
+        :type refresh: float
+        """
+        super(_Shard, self).__init__(keypressed)
+        self.refresh = refresh
+        self.records = []
+        # uid -> (bitmask, time) of the last states that were forwarded
+        self._forwarded = {}
+
+    def _new_controller(self, addr, port):
+        self.records.append((NEW, None, addr, port))
+
+    def _ping(self, uid, addr, port):
+        self.records.append((PING, uid, addr, port))
+
+    def _del_controller(self, uid):
+        self._forwarded.pop(uid, None)
+        self.records.append((BYE, uid, None, None))
+
+    def _got_message(self, uid, text):
+        self.records.append((TEXT, uid, None, text))
+
+    def _set_states(self, uid, current):
+        now = time.time()
+        if not self.keypressed:
+            last = self._forwarded.get(uid)
+            if last is not None and last[0] == current and now - last[1] < self.refresh:
+                # nothing changed, the game doesn't need to know
+                return
+        self._forwarded[uid] = (current, now)
+        self.records.append((STATES, uid, None, current))
+
+    def prune(self, now):
+        """
+        Forget the states of controllers that didn't send any for a few refresh periods, they are probably gone. If
+        not, their next states just get forwarded.
+
+        :param now: Current time
+        :type now: float
+        """
+        limit = now - 3 * self.refresh
+        self._forwarded = {uid: last for uid, last in self._forwarded.items() if last[1] >= limit}
+
+
+def _run_shard(sock, conn, keypressed, batch_size, others):
+    """
+    Main function of a receiver process.
+
+    :param sock: Bound socket to read from
+    :param conn: Pipe to the game process
+    :param keypressed: The game wants E_KEYPRESSED events
+    :param batch_size: Maximum number of datagrams that are read and handled in one go
+    :param others: Sockets of the other receivers, inherited by accident
+    """
+    for other in others:
+        if other is not sock:
+            other.close()
+    parent = os.getppid()
+    shard = _Shard(keypressed)
+    next_prune = time.time() + shard.refresh
+    while True:
+        readable = select.select([sock], [], [], 1.0)[0]
+        now = time.time()
+        if now >= next_prune:
+            shard.prune(now)
+            next_prune = now + shard.refresh
+        if not readable:
+            if os.getppid() != parent:
+                # the game is gone
+                return
+            continue
+        for data, sender in receive(sock, batch_size):
+            shard._handle(data, sender[0])
+        if shard.malformed:
+            shard.records.append((MALFORMED, None, None, shard.malformed))
+            shard.malformed = 0
+        if shard.records:
+            try:
+                conn.send(shard.records)
+            except (OSError, EOFError):
+                return
+            shard.records = []
+
+
+class ShardedController(BaseController, Thread):
+    """
+    A Controller that parses the datagrams of the controllers in several processes, so input handling doesn't share
+    the GIL with the game. All receiver processes bind the same port with SO_REUSEPORT and the kernel spreads the
+    controllers over them. They parse the datagrams, drop states updates that didn't change anything and send what's
+    left over a pipe. The registry and the uids stay in the game process, so they are the same for all processes.
+
+    Needs Linux (SO_REUSEPORT and fork).
+    """
+    def __init__(self, host='0.0.0.0', port=1338, shards=2, keypressed=True, timeout=60, rcvbuf=None,
+                 batch_size=256):
+        """
+        Creates the controller deamon, the receiver processes get started together with it.
+
+        :param host: Bind to address
+        :param port: Bind to port
+        :param shards: Number of receiver processes
+        :param keypressed: Send E_KEYPRESSED events for every held button with every states update
+        :param timeout: Disconnect controllers that haven't sent anything for this many seconds
+        :param rcvbuf: Size of the receive buffer of each socket in bytes, the system default if None
+        :param batch_size: Maximum number of datagrams that are read and handled in one go
+        :type host: str
+        :type port: int
+        :type shards: int
+        :type keypressed: bool
+        :type timeout: float
+        :type rcvbuf: int
+        :type batch_size: int
+        """
+        BaseController.__init__(self, keypressed, timeout)
+        Thread.__init__(self)
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.running = False
+        # the receivers have their own sockets, this one is for sending
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # bind all sockets here, so errors show up right away and nothing gets lost before the processes run
+        self._sockets = []
+        for _ in range(shards):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            sock.bind((host, port))
+            sock.setblocking(False)
+            self._sockets.append(sock)
+            if port == 0:
+                # all the others have to use the same port
+                host, port = sock.getsockname()
+        self.port = port
+        self._connections = []
+        self._processes = []
+
+    def _sendto(self, data, address):
+        return self.sock.sendto(data, address)
+
+    def start(self):
+        """
+        Start the receiver processes and the thread that hands their events to the game.
+        """
+        context = multiprocessing.get_context('fork')
+        for sock in self._sockets:
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(target=_run_shard,
+                                      args=(sock, writer, self.keypressed, self.batch_size, self._sockets),
+                                      daemon=True)
+            process.start()
+            writer.close()
+            self._connections.append(reader)
+            self._processes.append(process)
+        # the processes have their copies
+        for sock in self._sockets:
+            sock.close()
+        self._sockets = []
+        super(ShardedController, self).start()
+
+    def stop(self):
+        """
+        Let the thread end and stop the receiver processes.
+        """
+        self.running = False
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        self._processes = []
+
+    def _apply(self, records):
+        """
+        Do what the records of a receiver process say and give all resulting events to the game at once.
+
+        :param records: (command, uid, address, value) tuples
+        :type records: list
+        """
+        self._batch = batch = []
+        try:
+            for command, uid, addr, value in records:
+                if command == STATES:
+                    self._set_states(uid, value)
+                elif command == NEW:
+                    try:
+                        self._new_controller(addr, value)
+                    except (OverflowError, OSError):
+                        self.malformed += 1
+                elif command == PING:
+                    self._ping(uid, addr, value)
+                elif command == BYE:
+                    self._del_controller(uid)
+                elif command == TEXT:
+                    self._got_message(uid, value)
+                elif command == MALFORMED:
+                    self.malformed += value
+        finally:
+            self._batch = None
+        if batch:
+            self.queue.put_many(batch)
+
+    def run(self):
+        """
+        Take the records from the receiver processes.
+        """
+        interval = min(1.0, self.timeout)
+        next_expiry = time.time() + interval
+        self.running = True
+        while self.running and self._connections:
+            for conn in wait(self._connections, max(next_expiry - time.time(), 0)):
+                try:
+                    records = conn.recv()
+                except (EOFError, OSError):
+                    # the receiver process died
+                    self._connections.remove(conn)
+                    continue
+                self._apply(records)
+
+            now = time.time()
+            if now >= next_expiry:
+                self._expire(now)
+                next_expiry = now + interval
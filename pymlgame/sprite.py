@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+PyMLGame - Sprite
+"""
+
+from pymlgame.surface import Surface
+
+
+def _transform(surface, flip_x=False, flip_y=False, rotate=0):
+    """
+    Create a flipped and/or rotated copy of a surface. Flipping happens before rotating.
+
+    :param surface: Surface to transform
+    :param flip_x: Mirror horizontally
+    :param flip_y: Mirror vertically
+    :param rotate: Clockwise rotation in degrees, a multiple of 90
+    :type surface: Surface
+    :type flip_x: bool
+    :type flip_y: bool
+    :type rotate: int
+    :return: New surface
+    :rtype: Surface
+    """
+    rotate %= 360
+    if rotate % 90:
+        raise ValueError('Sprites can only be rotated by multiples of 90 degrees')
+    width = surface.width
+    height = surface.height
+    if rotate in (90, 270):
+        result = Surface(height, width, surface.palette)
+    else:
+        result = Surface(width, height, surface.palette)
+    depth = surface.depth
+    for y in range(height):
+        for x in range(width):
+            sx = width - 1 - x if flip_x else x
+            sy = height - 1 - y if flip_y else y
+            if rotate == 90:
+                dx, dy = height - 1 - y, x
+            elif rotate == 180:
+                dx, dy = width - 1 - x, height - 1 - y
+            elif rotate == 270:
+                dx, dy = y, width - 1 - x
+            else:
+                dx, dy = x, y
+            i = surface._offset(sx, sy)
+            j = result._offset(dx, dy)
+            result.pixels[j:j + depth] = surface.pixels[i:i + depth]
+    result.mark_dirty()
+    return result
+
+
+class SpriteSheet(object):
+    """
+    A surface with several frames of the same size next to each other. The frames are cut out once.
+    """
+    def __init__(self, surface, frame_width, frame_height, count=None):
+        """
+        Cut the sheet into frames, from left to right and top to bottom.
+
+        :param surface: The whole sheet
+        :param frame_width: Width of one frame
+        :param frame_height: Height of one frame
+        :param count: Number of frames on the sheet, all that fit by default
+        :type surface: Surface
+        :type frame_width: int
+        :type frame_height: int
+        :type count: int
+        """
+        self.surface = surface
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.frames = []
+        for y in range(0, surface.height - frame_height + 1, frame_height):
+            for x in range(0, surface.width - frame_width + 1, frame_width):
+                if count is not None and len(self.frames) >= count:
+                    break
+                frame = Surface(frame_width, frame_height, surface.palette)
+                frame.blit(surface, (0, 0), (x, y, frame_width, frame_height))
+                self.frames.append(frame)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+
+class Sprite(object):
+    """
+    One or more frames that get drawn with a transparent color. Transformed frames and the opaque parts of every frame
+    are calculated once and cached, so drawing only copies whole spans of pixels.
+    """
+    def __init__(self, frames, colorkey=None, fps=0):
+        """
+        Create a sprite.
+
+        :param frames: A surface, a list of surfaces or a SpriteSheet
+        :param colorkey: Color that is transparent
+        :param fps: Animation frames per second
+        :type frames: list
+        :type colorkey: tuple
+        :type fps: float
+        """
+        if isinstance(frames, Surface):
+            frames = [frames]
+        self.frames = list(frames)
+        self.colorkey = colorkey
+        self.fps = fps
+        # (frame, flip_x, flip_y, rotate) => (surface, spans)
+        self._cache = {}
+
+    @property
+    def width(self):
+        return self.frames[0].width
+
+    @property
+    def height(self):
+        return self.frames[0].height
+
+    def frame_index(self, clock):
+        """
+        Get the animation frame for the current time of the game clock.
+
+        :param clock: The clock of the game
+        :type clock: Clock
+        :return: Index of the frame
+        :rtype: int
+        """
+        if not self.fps or not clock.fps:
+            return 0
+        return int(clock.ticks * self.fps // clock.fps) % len(self.frames)
+
+    def _spans(self, surface):
+        """
+        Find the opaque spans of every row of a frame.
+
+        :param surface: The frame
+        :type surface: Surface
+        :return: One list of (start, end) ranges per row
+        :rtype: list
+        """
+        depth = surface.depth
+        key = None
+        if self.colorkey is not None:
+            if surface.palette is None:
+                key = bytes(map(int, self.colorkey))
+            elif tuple(self.colorkey) in surface.palette:
+                key = bytes((surface.palette.index(tuple(self.colorkey)),))
+        spans = []
+        for y in range(surface.height):
+            row = []
+            start = None
+            for x in range(surface.width):
+                i = surface._offset(x, y)
+                if surface.pixels[i:i + depth] == key:
+                    if start is not None:
+                        row.append((start, x))
+                        start = None
+                elif start is None:
+                    start = x
+            if start is not None:
+                row.append((start, surface.width))
+            spans.append(row)
+        return spans
+
+    def get_frame(self, index=0, flip_x=False, flip_y=False, rotate=0):
+        """
+        Get a frame, transformed if needed. The result is cached, don't draw on it.
+
+        :param index: Index of the frame
+        :param flip_x: Mirror horizontally
+        :param flip_y: Mirror vertically
+        :param rotate: Clockwise rotation in degrees, a multiple of 90
+        :type index: int
+        :type flip_x: bool
+        :type flip_y: bool
+        :type rotate: int
+        :return: The frame and its opaque spans
+        :rtype: tuple
+        """
+        key = (index, bool(flip_x), bool(flip_y), rotate % 360)
+        cached = self._cache.get(key)
+        if cached is None:
+            surface = self.frames[index]
+            if flip_x or flip_y or rotate % 360:
+                surface = _transform(surface, flip_x, flip_y, rotate)
+            cached = (surface, self._spans(surface))
+            self._cache[key] = cached
+        return cached
+
+    def draw(self, surface, pos, index=None, clock=None, flip_x=False, flip_y=False, rotate=0):
+        """
+        Draw the sprite on a surface. Pixels in the colorkey color are left out.
+
+        :param surface: Surface to draw on
+        :param pos: Top left corner of the sprite
+        :param index: Index of the frame, picked by the clock or the first one by default
+        :param clock: Clock to pick the animation frame
+        :param flip_x: Mirror horizontally
+        :param flip_y: Mirror vertically
+        :param rotate: Clockwise rotation in degrees, a multiple of 90
+        :type surface: Surface
+        :type pos: tuple
+        :type index: int
+        :type clock: Clock
+        :type flip_x: bool
+        :type flip_y: bool
+        :type rotate: int
+        """
+        if index is None:
+            index = self.frame_index(clock) if clock is not None else 0
+        frame, spans = self.get_frame(index, flip_x, flip_y, rotate)
+        px = int(pos[0])
+        py = int(pos[1])
+        top = max(py, 0)
+        bottom = min(py + frame.height, surface.height)
+        if top >= bottom or px >= surface.width or px + frame.width <= 0:
+            return
+
+        convert = surface._converter(frame)
+        src = memoryview(frame.pixels)
+        dst = surface.pixels
+        left = -px
+        right = surface.width - px
+        for y in range(top - py, bottom - py):
+            for start, end in spans[y]:
+                start = max(start, left)
+                end = min(end, right)
+                if start < end:
+                    pixels = src[frame._offset(start, y):frame._offset(end, y)]
+                    i = surface._offset(px + start, py + y)
+                    dst[i:i + (end - start) * surface.depth] = pixels if convert is None else convert(pixels)
+        surface.mark_dirty(top, bottom - top)
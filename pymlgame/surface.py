@@ -4,23 +4,398 @@
 PyMLGame - Surface
 """
 
-import math
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from pymlgame.locals import BLACK
 
 
+def _color_bytes(color):
+    """
+    Convert a color tuple into the 3 bytes used in the pixel buffer.
+
+    :param color: Color as (r, g, b)
+    :type color: tuple
+    :return: Color as bytes
+    :rtype: bytes
+    """
+    return bytes(map(int, color))
+
+
+class _MatrixColumn(object):
+    """
+    One column of a surface, indexed by y. Reads and writes go straight to the pixel buffer.
+    """
+    def __init__(self, surface, x):
+        self._surface = surface
+        self._x = x
+
+    def __len__(self):
+        return self._surface.height
+
+    def _offset(self, y):
+        if y < 0:
+            y += self._surface.height
+        if not 0 <= y < self._surface.height:
+            raise IndexError('column index out of range')
+        return (y * self._surface.width + self._x) * self._surface.depth
+
+    def __getitem__(self, y):
+        i = self._offset(y)
+        return self._surface._decode(self._surface.pixels[i:i + self._surface.depth])
+
+    def __setitem__(self, y, color):
+        i = self._offset(y)
+        self._surface.pixels[i:i + self._surface.depth] = self._surface._encode(color)
+        self._surface.mark_dirty(y % self._surface.height, 1)
+
+    def __iter__(self):
+        for y in range(self._surface.height):
+            yield self[y]
+
+
+class _MatrixView(object):
+    """
+    Column major view (matrix[x][y]) on the pixel buffer of a surface.
+    """
+    def __init__(self, surface):
+        self._surface = surface
+
+    def __len__(self):
+        return self._surface.width
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self._surface.width
+        if not 0 <= x < self._surface.width:
+            raise IndexError('matrix index out of range')
+        return _MatrixColumn(self._surface, x)
+
+    def __iter__(self):
+        for x in range(self._surface.width):
+            yield self[x]
+
+
+def _visible_steps(start, step, size, length):
+    """
+    Get the steps k of a line, with 0 <= k <= length, that land on 0 <= start + step * k < size.
+
+    :return: First and last step, the first is bigger than the last if there are none
+    :rtype: tuple
+    """
+    if step > 0:
+        return max(0, -start), min(length, size - 1 - start)
+    return max(0, start - size + 1), min(length, start)
+
+
 class Surface(object):
     """
-    Represents a sheet to draw on
+    Represents a sheet to draw on.
+
+    The pixels are stored in one contiguous bytearray (height x width x 3, row major, RGB) so most operations work on
+    whole slices instead of single pixels. The old column major access through matrix[x][y] still works on top of it.
+
+    Every change increases the version of the surface and remembers it for the rows it touched, so whoever uses the
+    surface can find out what changed since the last time it looked.
+
+    With a palette the surface is indexed: every pixel is one byte pointing into the palette (up to 256 colors).
+    Colors are still given as (r, g, b) and get added to the palette when they are not in it yet, but you can also
+    use the index directly. Changing a palette entry recolors all its pixels at once.
     """
-    def __init__(self, width, height):
+    def __init__(self, width, height, palette=None):
         """
-        Create a surface with default size and fill it with black pixels.
+        Create a surface with default size and fill it with black pixels. Indexed surfaces get filled with the first
+        color of the palette.
+
+        :param width: Width of the surface
+        :param height: Height of the surface
+        :param palette: List of colors for an indexed surface
+        :type width: int
+        :type height: int
+        :type palette: list
         """
         self.width = width
         self.height = height
-        self.matrix = None
-        self.fill(BLACK)
+        if palette is None:
+            self.palette = None
+            self.depth = 3
+        else:
+            self.palette = [tuple(color) for color in palette] or [BLACK]
+            if len(self.palette) > 256:
+                raise ValueError('A palette can have 256 colors at most')
+            self.depth = 1
+        self.pixels = bytearray(width * height * self.depth)
+        self.version = 0
+        self._row_versions = [0] * height
+        self.fill(BLACK if palette is None else 0)
+
+    @property
+    def matrix(self):
+        """
+        Column major access to the pixels, use it like matrix[x][y].
+        """
+        return _MatrixView(self)
+
+    @matrix.setter
+    def matrix(self, matrix):
+        for x in range(self.width):
+            for y in range(self.height):
+                i = self._offset(x, y)
+                self.pixels[i:i + self.depth] = self._encode(matrix[x][y])
+        self.mark_dirty()
+
+    @property
+    def array(self):
+        """
+        A numpy array (height x width x 3, uint8, or height x width for indexed surfaces) sharing its memory with the
+        pixel buffer. Needs numpy. Call mark_dirty() after writing to it.
+        """
+        if numpy is None:
+            raise ImportError('Surface.array needs numpy')
+        array = numpy.frombuffer(self.pixels, dtype=numpy.uint8)
+        if self.palette is None:
+            return array.reshape(self.height, self.width, 3)
+        return array.reshape(self.height, self.width)
+
+    def _encode(self, color):
+        """
+        Get the bytes of one pixel in the given color.
+
+        :param color: Color as (r, g, b) or palette index
+        :type color: tuple
+        :return: Pixel as bytes
+        :rtype: bytes
+        """
+        if self.palette is None:
+            return _color_bytes(color)
+        if isinstance(color, int):
+            return bytes((color,))
+        return bytes((self._palette_index(color),))
+
+    def _decode(self, pixel):
+        """
+        Get the color of the bytes of one pixel.
+
+        :param pixel: Pixel as bytes
+        :type pixel: bytes
+        :return: Color as (r, g, b)
+        :rtype: tuple
+        """
+        if self.palette is None:
+            return tuple(pixel)
+        return self.palette[pixel[0]]
+
+    def _palette_index(self, color):
+        """
+        Find a color in the palette and add it if it's not in there yet.
+
+        :param color: Color as (r, g, b)
+        :type color: tuple
+        :return: Index in the palette
+        :rtype: int
+        """
+        color = tuple(color)
+        try:
+            return self.palette.index(color)
+        except ValueError:
+            if len(self.palette) >= 256:
+                raise ValueError('The palette is full, {} does not fit in anymore'.format(color))
+            self.palette.append(color)
+            return len(self.palette) - 1
+
+    def lookup_tables(self):
+        """
+        Get the translation tables that turn palette indices into the red, green and blue bytes of their color.
+
+        :return: Three tables of 256 bytes for bytes.translate
+        :rtype: tuple
+        """
+        padding = bytes(256 - len(self.palette))
+        return tuple(bytes(color[channel] for color in self.palette) + padding for channel in range(3))
+
+    def to_rgb(self, pixels, lookup_tables=None):
+        """
+        Turn palette indices into RGB bytes.
+
+        :param pixels: Palette indices
+        :param lookup_tables: Tables from lookup_tables(), they get created if they are not given
+        :type pixels: bytes
+        :type lookup_tables: tuple
+        :return: RGB bytes
+        :rtype: bytearray
+        """
+        if lookup_tables is None:
+            lookup_tables = self.lookup_tables()
+        pixels = bytes(pixels)
+        rgb = bytearray(len(pixels) * 3)
+        for channel in range(3):
+            rgb[channel::3] = pixels.translate(lookup_tables[channel])
+        return rgb
+
+    def set_palette_color(self, index, color):
+        """
+        Change one color of the palette. All pixels using it change with it.
+
+        :param index: Index in the palette
+        :param color: New color
+        :type index: int
+        :type color: tuple
+        """
+        self.palette[index] = tuple(color)
+        self.mark_dirty()
+
+    def cycle_palette(self, start=0, end=None, step=1):
+        """
+        Rotate the colors of a range of the palette, e.g. for water or fire effects.
+
+        :param start: First index of the range
+        :param end: Last index + 1 of the range, the end of the palette by default
+        :param step: Number of entries to rotate by
+        :type start: int
+        :type end: int
+        :type step: int
+        """
+        if end is None:
+            end = len(self.palette)
+        colors = self.palette[start:end]
+        if colors:
+            step %= len(colors)
+            self.palette[start:end] = colors[-step:] + colors[:-step]
+            self.mark_dirty()
+
+    def mark_dirty(self, y=0, height=None):
+        """
+        Tell the surface that some of its rows changed. The drawing methods do this on their own, you only need it
+        after writing to pixels or array directly.
+
+        :param y: First changed row
+        :param height: Number of changed rows, all rows down to the bottom by default
+        :type y: int
+        :type height: int
+        """
+        if height is None:
+            height = self.height - y
+        top = max(y, 0)
+        bottom = min(y + height, self.height)
+        if top < bottom:
+            self.version += 1
+            self._row_versions[top:bottom] = [self.version] * (bottom - top)
+
+    def dirty_rows(self, since=0):
+        """
+        Get the rows that changed after the given version.
+
+        :param since: Version of the surface the caller knows about
+        :type since: int
+        :return: Changed rows as list of (first, last + 1) ranges
+        :rtype: list
+        """
+        if self.version <= since:
+            return []
+        if min(self._row_versions) > since:
+            return [(0, self.height)]
+        rows = []
+        start = None
+        for y, version in enumerate(self._row_versions):
+            if version > since:
+                if start is None:
+                    start = y
+            elif start is not None:
+                rows.append((start, y))
+                start = None
+        if start is not None:
+            rows.append((start, self.height))
+        return rows
+
+    def _offset(self, x, y):
+        """
+        Get the index of the first byte of a pixel in the pixel buffer.
+
+        :param x: X coordinate of the pixel
+        :param y: Y coordinate of the pixel
+        :type x: int
+        :type y: int
+        :return: Index in the pixel buffer
+        :rtype: int
+        """
+        return (y * self.width + x) * self.depth
+
+    def _clip_rect(self, x, y, width, height):
+        """
+        Clip a rectangle against the surface.
+
+        :param x: Left edge
+        :param y: Top edge
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :type x: int
+        :type y: int
+        :type width: int
+        :type height: int
+        :return: The visible part as (x, y, width, height) or None if nothing is visible
+        :rtype: tuple
+        """
+        left = max(x, 0)
+        top = max(y, 0)
+        right = min(x + width, self.width)
+        bottom = min(y + height, self.height)
+        if left >= right or top >= bottom:
+            return None
+        return left, top, right - left, bottom - top
+
+    def _hline(self, x, y, length, color):
+        """
+        Draw a horizontal span with one slice assignment. The span gets clipped to the surface.
+
+        :param x: Leftmost x coordinate
+        :param y: Row
+        :param length: Number of pixels
+        :param color: Color as bytes
+        :type x: int
+        :type y: int
+        :type length: int
+        :type color: bytes
+        """
+        if not 0 <= y < self.height:
+            return
+        start = max(x, 0)
+        end = min(x + length, self.width)
+        if start < end:
+            i = self._offset(start, y)
+            self.pixels[i:i + (end - start) * self.depth] = color * (end - start)
+
+    def _fill_rect(self, x, y, width, height, color):
+        """
+        Fill a rectangle. It gets clipped once and is then written as whole rows.
+
+        :param x: Left edge
+        :param y: Top edge
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :param color: Color as bytes
+        :type x: int
+        :type y: int
+        :type width: int
+        :type height: int
+        :type color: bytes
+        """
+        clipped = self._clip_rect(x, y, width, height)
+        if clipped is None:
+            return
+        x, y, width, height = clipped
+        self.mark_dirty(y, height)
+        start = self._offset(x, y)
+        if width == self.width:
+            # the rows are contiguous, one slice does it
+            self.pixels[start:start + width * height * self.depth] = color * (width * height)
+            return
+        span = color * width
+        length = width * self.depth
+        stride = self.width * self.depth
+        for i in range(start, start + height * stride, stride):
+            self.pixels[i:i + length] = span
 
     def fill(self, color):
         """
@@ -29,7 +404,8 @@ class Surface(object):
         :param color: Color to use for filling
         :type color: tuple
         """
-        self.matrix = [[color for _ in range(self.height)] for _ in range(self.width)]
+        self.pixels[:] = self._encode(color) * (self.width * self.height)
+        self.mark_dirty()
 
     def draw_dot(self, pos, color):
         """
@@ -41,11 +417,14 @@ class Surface(object):
         :type color: tuple
         """
         if 0 <= pos[0] < self.width and 0 <= pos[1] < self.height:
-            self.matrix[pos[0]][pos[1]] = color
+            i = self._offset(pos[0], pos[1])
+            self.pixels[i:i + self.depth] = self._encode(color)
+            self.mark_dirty(pos[1], 1)
 
     def draw_line(self, start, end, color):
         """
-        Draw a line with the given color on the screen.
+        Draw a line with the given color on the screen. Uses Bresenham's algorithm, only the part of the line that is
+        on the surface gets drawn.
 
         :param start: Start point of the line
         :param end: End point of the line
@@ -54,17 +433,96 @@ class Surface(object):
         :type end: tuple
         :type color: tuple
         """
-        def dist(p, a, b):
-            return (abs((b[0] - a[0]) * (a[1] - p[1]) - (a[0] - p[0]) * (b[1] - a[1])) /
-                    math.sqrt((b[0] - a[0])**2 + (b[1] - a[1])**2))
+        self._line(int(start[0]), int(start[1]), int(end[0]), int(end[1]), self._encode(color))
+
+    def draw_lines(self, points, color, closed=False):
+        """
+        Draw a polyline through all points with the given color on the screen.
+
+        :param points: Points to connect
+        :param color: Color of the lines
+        :param closed: Also connect the last point with the first one
+        :type points: list
+        :type color: tuple
+        :type closed: bool
+        """
+        points = [(int(x), int(y)) for x, y in points]
+        if closed and len(points) > 2:
+            points.append(points[0])
+        color = self._encode(color)
+        if len(points) == 1:
+            self._line(points[0][0], points[0][1], points[0][0], points[0][1], color)
+        for start, end in zip(points, points[1:]):
+            self._line(start[0], start[1], end[0], end[1], color)
+
+    def _line(self, x0, y0, x1, y1, color):
+        """
+        Rasterize a line between two integer points.
+
+        :param x0: X coordinate of the start point
+        :param y0: Y coordinate of the start point
+        :param x1: X coordinate of the end point
+        :param y1: Y coordinate of the end point
+        :param color: Color as bytes
+        :type x0: int
+        :type y0: int
+        :type x1: int
+        :type y1: int
+        :type color: bytes
+        """
+        width = self.width
+        height = self.height
+        # not on the surface at all
+        if max(x0, x1) < 0 or min(x0, x1) >= width or max(y0, y1) < 0 or min(y0, y1) >= height:
+            return
+        self.mark_dirty(min(y0, y1), abs(y1 - y0) + 1)
+        # horizontal lines are just one span
+        if y0 == y1:
+            self._hline(min(x0, x1), y0, abs(x1 - x0) + 1, color)
+            return
+
+        # step k along the major axis moves (2 * k * minor + major) // (2 * major) along the minor axis, that's exactly
+        # the point Bresenham's algorithm gets to. so the visible steps can be found up front and nothing off the
+        # surface has to be walked
+        dx = abs(x1 - x0)
+        dy = abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        steep = dy > dx
+        if steep:
+            a0, sa, a_size, major, b0, sb, b_size, minor = y0, sy, height, dy, x0, sx, width, dx
+        else:
+            a0, sa, a_size, major, b0, sb, b_size, minor = x0, sx, width, dx, y0, sy, height, dy
+        first, last = _visible_steps(a0, sa, a_size, major)
+        low, high = _visible_steps(b0, sb, b_size, minor)
+        if minor:
+            # steps whose minor offset is between low and high
+            first = max(first, -((major - 2 * low * major) // (2 * minor)))
+            last = min(last, -(-(2 * high + 1) * major // (2 * minor)) - 1)
+        elif low > 0 or high < 0:
+            return
 
-        points = []
-        for x in range(min(start[0], end[0]), max(start[0], end[0]) + 1):
-            for y in range(min(start[1], end[1]), max(start[1], end[1]) + 1):
-                if dist((x, y), start, end) < 0.5:
-                    points.append((x, y))
-        for point in points:
-            self.draw_dot(point, color)
+        pixels = self.pixels
+        depth = self.depth
+        for k in range(first, last + 1):
+            a = a0 + sa * k
+            b = b0 + sb * ((2 * k * minor + major) // (2 * major))
+            i = ((b * width + a) if not steep else (a * width + b)) * depth
+            pixels[i:i + depth] = color
+
+    def fill_rect(self, pos, size, color):
+        """
+        Fill a rectangle with the given color on the screen. This is the fast way to draw a filled rectangle without a
+        border.
+
+        :param pos: Top left corner of the rectangle
+        :param size: Size of the rectangle
+        :param color: Color for the rectangle
+        :type pos: tuple
+        :type size: tuple
+        :type color: tuple
+        """
+        self._fill_rect(int(pos[0]), int(pos[1]), int(size[0]), int(size[1]), self._encode(color))
 
     def draw_rect(self, pos, size, color, fillcolor=None):
         """
@@ -79,19 +537,22 @@ class Surface(object):
         :type color: tuple
         :type fillcolor: tuple
         """
+        x = int(pos[0])
+        y = int(pos[1])
+        width = int(size[0])
+        height = int(size[1])
+        if self._clip_rect(x, y, width, height) is None:
+            return
+        color = self._encode(color)
+        # draw filled rect
+        if fillcolor is not None and width >= 3 and height >= 3:
+            self._fill_rect(x + 1, y + 1, width - 2, height - 2, self._encode(fillcolor))
         # draw top and botton line
-        for x in range(size[0]):
-            self.draw_dot((pos[0] + x, pos[1]), color)
-            self.draw_dot((pos[0] + x, pos[1] + size[1] - 1), color)
+        self._fill_rect(x, y, width, 1, color)
+        self._fill_rect(x, y + height - 1, width, 1, color)
         # draw left and right side
-        for y in range(size[1]):
-            self.draw_dot((pos[0], pos[1] + y), color)
-            self.draw_dot((pos[0] + size[0] - 1, pos[1] + y), color)
-        # draw filled rect
-        if fillcolor and size[0] >= 3 and size[1] >= 3:
-            for x in range(size[0] - 2):
-                for y in range(size[1] - 2):
-                    self.draw_dot((pos[0] + 1 + x, pos[1] + 1 + y), fillcolor)
+        self._fill_rect(x, y + 1, 1, height - 2, color)
+        self._fill_rect(x + width - 1, y + 1, 1, height - 2, color)
 
     def draw_circle(self, pos, radius, color, fillcolor=None):
         """
@@ -106,53 +567,249 @@ class Surface(object):
         :type color: tuple
         :type fillcolor: tuple
         """
-        #TODO: This still produces rubbish but it's on a good way to success
-        def dist(d, p, r):
-            return abs(math.sqrt((p[0] - d[0])**2 + (p[1] - d[1])**2) - r)
+        radius = int(radius)
+        if radius < 0:
+            return
+
+        # midpoint circle, every step gives one point per octant
+        quadrant = []
+        x = radius
+        y = 0
+        err = 1 - radius
+        while x >= y:
+            quadrant.append((x, y))
+            quadrant.append((y, x))
+            y += 1
+            if err < 0:
+                err += 2 * y + 1
+            else:
+                x -= 1
+                err += 2 * (y - x) + 1
+
+        self._draw_quadrant(int(pos[0]), int(pos[1]), quadrant, color, fillcolor)
+
+    def draw_ellipse(self, pos, radius, color, fillcolor=None):
+        """
+        Draw an ellipse with the given color on the screen and optionally fill it with fillcolor.
+
+        :param pos: Center of the ellipse
+        :param radius: Horizontal and vertical radius
+        :param color: Color for border
+        :param fillcolor: Color for infill
+        :type pos: tuple
+        :type radius: tuple
+        :type color: tuple
+        :type fillcolor: tuple
+        """
+        rx = int(radius[0])
+        ry = int(radius[1])
+        if rx < 0 or ry < 0:
+            return
+        if ry == 0:
+            # flat, region 1 would never start
+            self._draw_quadrant(int(pos[0]), int(pos[1]), [(x, 0) for x in range(rx + 1)], color, fillcolor)
+            return
+        if rx == 0:
+            # upright, region 2 would step along x anyway for small ry
+            self._draw_quadrant(int(pos[0]), int(pos[1]), [(0, y) for y in range(ry + 1)], color, fillcolor)
+            return
+
+        # midpoint ellipse, region 1 steps along x and region 2 along y
+        quadrant = []
+        rx2 = rx * rx
+        ry2 = ry * ry
+        x = 0
+        y = ry
+        px = 0
+        py = 2 * rx2 * y
+        p = ry2 - rx2 * ry + rx2 // 4
+        while px < py:
+            quadrant.append((x, y))
+            x += 1
+            px += 2 * ry2
+            if p < 0:
+                p += ry2 + px
+            else:
+                y -= 1
+                py -= 2 * rx2
+                p += ry2 + px - py
+        p = ry2 * (x * x + x) + ry2 // 4 + rx2 * (y - 1) * (y - 1) - rx2 * ry2
+        while y >= 0:
+            quadrant.append((x, y))
+            y -= 1
+            py -= 2 * rx2
+            if p > 0:
+                p += rx2 - py
+            else:
+                x += 1
+                px += 2 * ry2
+                p += rx2 - py + px
+
+        self._draw_quadrant(int(pos[0]), int(pos[1]), quadrant, color, fillcolor)
+
+    def _draw_quadrant(self, cx, cy, quadrant, color, fillcolor=None):
+        """
+        Mirror the outline points of one quadrant into all four and draw them. The infill is drawn as one span per
+        row before the outline.
+
+        :param cx: X coordinate of the center
+        :param cy: Y coordinate of the center
+        :param quadrant: Outline points relative to the center with x >= 0 and y >= 0
+        :param color: Color for border
+        :param fillcolor: Color for infill
+        :type cx: int
+        :type cy: int
+        :type quadrant: list
+        :type color: tuple
+        :type fillcolor: tuple
+        """
+        reach = max(y for x, y in quadrant)
+        self.mark_dirty(cy - reach, 2 * reach + 1)
+
+        if fillcolor is not None:
+            fillcolor = self._encode(fillcolor)
+            spans = {}
+            for x, y in quadrant:
+                if x > spans.get(y, -1):
+                    spans[y] = x
+            for y, x in spans.items():
+                self._hline(cx - x, cy - y, 2 * x + 1, fillcolor)
+                if y:
+                    self._hline(cx - x, cy + y, 2 * x + 1, fillcolor)
+
+        color = self._encode(color)
+        width = self.width
+        height = self.height
+        pixels = self.pixels
+        depth = self.depth
+        for x, y in set(quadrant):
+            for px, py in {(cx + x, cy + y), (cx - x, cy + y), (cx + x, cy - y), (cx - x, cy - y)}:
+                if 0 <= px < width and 0 <= py < height:
+                    i = (py * width + px) * depth
+                    pixels[i:i + depth] = color
+
+    def _converter(self, surface):
+        """
+        Get a function that turns pixels of another surface into pixels of this one.
 
-        points = []
-        for x in range(pos[0] - radius, pos[0] + radius):
-            for y in range(pos[1] - radius, pos[1] + radius):
-                if 0 < x < self.width and 0 < y < self.height:
-                    if dist((x, y), pos, radius) < 1.3:
-                        points.append((x, y))
+        :param surface: Surface the pixels come from
+        :type surface: Surface
+        :return: Conversion function or None if the pixels can be copied as they are
+        :rtype: callable
+        """
+        if surface.palette is None:
+            if self.palette is None:
+                return None
 
-        # draw fill color
-        if fillcolor:
-            for point in points:
-                pass
-        # draw outline
-        for point in points:
-            self.draw_dot(point, color)
+            # rgb on an indexed surface, every pixel has to be looked up
+            def convert(pixels):
+                return bytes(self._palette_index(tuple(pixels[i:i + 3])) for i in range(0, len(pixels), 3))
+            return convert
 
-    def blit(self, surface, pos=(0, 0)):
+        if self.palette is None:
+            tables = surface.lookup_tables()
+            return lambda pixels: surface.to_rgb(pixels, tables)
+        if self.palette[:len(surface.palette)] == surface.palette:
+            # same colors at the same indices
+            return None
+        table = bytes(self._palette_index(color) for color in surface.palette) + bytes(256 - len(surface.palette))
+        return lambda pixels: bytes(pixels).translate(table)
+
+    def blit(self, surface, pos=(0, 0), area=None):
         """
-        Blits a surface on this surface at pos
+        Blits a surface on this surface at pos. Only the visible part gets copied, row by row. Pixels get converted if
+        one of the surfaces is indexed.
 
         :param surface: Surface to blit
         :param pos: Top left point to start blitting
+        :param area: Only blit this part (x, y, width, height) of the surface
         :type surface: Surface
         :type pos: tuple
+        :type area: tuple
         """
-        for x in range(surface.width):
-            for y in range(surface.height):
-                px = x + pos[0]
-                py = y + pos[1]
-                if 0 <= px < self.width and 0 <= py < self.height:
-                    self.matrix[px][py] = surface.matrix[x][y]
+        if area is None:
+            area_x, area_y, area_right, area_bottom = 0, 0, surface.width, surface.height
+        else:
+            area_x = max(area[0], 0)
+            area_y = max(area[1], 0)
+            area_right = min(area[0] + area[2], surface.width)
+            area_bottom = min(area[1] + area[3], surface.height)
+            # the part of the area that sticks out of the surface moves what's left
+            pos = (pos[0] + area_x - area[0], pos[1] + area_y - area[1])
+        # clip the source rect against this surface
+        src_x = area_x + max(0, -pos[0])
+        src_y = area_y + max(0, -pos[1])
+        dst_x = max(pos[0], 0)
+        dst_y = max(pos[1], 0)
+        width = min(area_right - src_x, self.width - dst_x)
+        height = min(area_bottom - src_y, self.height - dst_y)
+        if width <= 0 or height <= 0:
+            return
+        self.mark_dirty(dst_y, height)
+
+        convert = self._converter(surface)
+        src = bytes(surface.pixels) if surface is self else memoryview(surface.pixels)
+        if width == self.width == surface.width:
+            # whole rows on both sides, copy everything at once
+            dst_i = self._offset(0, dst_y)
+            src_i = surface._offset(0, src_y)
+            pixels = src[src_i:src_i + width * height * surface.depth]
+            self.pixels[dst_i:dst_i + width * height * self.depth] = pixels if convert is None else convert(pixels)
+        else:
+            src_length = width * surface.depth
+            dst_length = width * self.depth
+            for row in range(height):
+                dst_i = self._offset(dst_x, dst_y + row)
+                src_i = surface._offset(src_x, src_y + row)
+                pixels = src[src_i:src_i + src_length]
+                self.pixels[dst_i:dst_i + dst_length] = pixels if convert is None else convert(pixels)
 
     def replace_color(self, before, after):
         """
-        Replaces a color on a surface with another one.
+        Replaces a color on a surface with another one. On indexed surfaces only the palette changes.
 
         :param before: Change all pixels with this color
         :param after: To that color
         :type before: tuple
         :type after: tuple
         """
-        #TODO: find out if this actually works
-        #((self.matrix[x][y] = after for y in range(self.height) if self.matrix[x][y] == before) for x in range(self.width))
-        for x in range(self.width):
-            for y in range(self.height):
-                if self.matrix[x][y] == before:
-                    self.matrix[x][y] = after
+        if self.palette is not None:
+            before = tuple(before)
+            after = tuple(after)
+            replaced = False
+            for index, color in enumerate(self.palette):
+                if color == before:
+                    self.palette[index] = after
+                    replaced = True
+            if replaced:
+                self.mark_dirty()
+            return
+
+        if numpy is not None:
+            array = self.array
+            mask = (array == tuple(before)).all(axis=2)
+            array[mask] = tuple(after)
+            rows = mask.any(axis=1).nonzero()[0]
+            if len(rows):
+                self.mark_dirty(int(rows[0]), int(rows[-1]) - int(rows[0]) + 1)
+            return
+
+        before = _color_bytes(before)
+        after = _color_bytes(after)
+        pixels = self.pixels
+        first = None
+        last = None
+        i = pixels.find(before)
+        while i != -1:
+            if i % 3 == 0:
+                pixels[i:i + 3] = after
+                if first is None:
+                    first = i
+                last = i
+                i = pixels.find(before, i + 3)
+            else:
+                # match across two pixels, keep searching
+                i = pixels.find(before, i + 1)
+        if first is not None:
+            row = self.width * 3
+            self.mark_dirty(first // row, last // row - first // row + 1)
@@ -14,9 +14,13 @@ __maintainer__ = 'Ricardo Band'
 __email__ = 'me@xengi.de'
 __status__ = 'Development'
 
+import io
+import asyncio
 import time
 import random
+import socket
 import unittest
+from unittest import mock
 
 import pymlgame
 
@@ -32,6 +36,9 @@ class ScreenTest(unittest.TestCase):
     def setUp(self):
         self.screen = pymlgame.Screen(TEST_HOST, TEST_PORT, TEST_WIDTH, TEST_HEIGHT)
 
+    def tearDown(self):
+        self.screen.close()
+
     def test_host_port(self):
         self.assertEqual(self.screen.host, TEST_HOST)
         self.assertEqual(self.screen.port, TEST_PORT)
@@ -65,7 +72,49 @@ class ScreenTest(unittest.TestCase):
         self.assertEqual(self.screen.matrix[TEST_WIDTH - 1][TEST_HEIGHT - 1], pymlgame.BLACK)
 
     def test_update(self):
-        pass
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((TEST_HOST, 0))
+        sock.settimeout(1)
+        screen = pymlgame.Screen(TEST_HOST, sock.getsockname()[1], 4, 2)
+        screen.draw_dot((1, 1), pymlgame.RED)
+        screen.update()
+        screen.update()
+
+        for _ in range(2):
+            data, _ = sock.recvfrom(1024)
+            self.assertEqual(len(data), 4 * 2 * 3 + 4)
+            self.assertEqual(data[15:18], bytes(pymlgame.RED))
+            self.assertEqual(data[-4:], bytes(4))
+        screen.close()
+        sock.close()
+
+    def test_skip_duplicates(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((TEST_HOST, 0))
+        screen = pymlgame.Screen(TEST_HOST, sock.getsockname()[1], 4, 2, skip_duplicates=True, keepalive=0.2)
+
+        self.assertTrue(screen.update())
+        self.assertFalse(screen.update())
+        # drawing the same content again is still a duplicate
+        screen.fill(pymlgame.BLACK)
+        self.assertFalse(screen.update())
+        screen.draw_dot((0, 0), pymlgame.RED)
+        self.assertTrue(screen.update())
+        self.assertFalse(screen.update())
+        time.sleep(0.25)
+        self.assertTrue(screen.update())
+
+        self.assertEqual(screen.frames_sent, 3)
+        self.assertEqual(screen.frames_suppressed, 3)
+        screen.close()
+        sock.close()
+
+    def test_serialize(self):
+        self.screen.draw_dot((TEST_WIDTH - 1, TEST_HEIGHT - 1), pymlgame.BLUE)
+        frame = self.screen.serialize()
+        self.assertIs(frame, self.screen.serialize())
+        self.assertEqual(len(frame), TEST_WIDTH * TEST_HEIGHT * 3 + 4)
+        self.assertEqual(bytes(frame[-7:-4]), bytes(pymlgame.BLUE))
 
     def test_blit(self):
         surface = pymlgame.Surface(TEST_WIDTH - 2, TEST_HEIGHT - 2)
@@ -79,6 +128,40 @@ class ScreenTest(unittest.TestCase):
                 else:
                     self.assertEqual(self.screen.matrix[x][y], pymlgame.BLACK)
 
+    def test_serialize_dirty_rows(self):
+        self.screen.serialize()
+        # direct writes are not seen until the row is marked dirty
+        self.screen.pixels[0:3] = bytes(pymlgame.RED)
+        self.assertEqual(bytes(self.screen.serialize()[0:3]), bytes(pymlgame.BLACK))
+        self.screen.mark_dirty(0, 1)
+        self.assertEqual(bytes(self.screen.serialize()[0:3]), bytes(pymlgame.RED))
+
+    def test_blit_unchanged(self):
+        surface = pymlgame.Surface(4, 4)
+        surface.fill(pymlgame.WHITE)
+        self.screen.blit(surface, (2, 2))
+        self.assertEqual(self.screen.matrix[2][2], pymlgame.WHITE)
+
+        # the surface did not change, so the second blit is skipped
+        i = (2 * TEST_WIDTH + 2) * 3
+        self.screen.pixels[i:i + 3] = bytes(pymlgame.RED)
+        self.screen.blit(surface, (2, 2))
+        self.assertEqual(self.screen.matrix[2][2], pymlgame.RED)
+
+        # something else was drawn below it
+        self.screen.draw_dot((20, 3), pymlgame.BLUE)
+        self.screen.blit(surface, (2, 2))
+        self.assertEqual(self.screen.matrix[2][2], pymlgame.WHITE)
+
+        # the surface changed
+        surface.draw_dot((0, 0), pymlgame.GREEN)
+        self.screen.blit(surface, (2, 2))
+        self.assertEqual(self.screen.matrix[2][2], pymlgame.GREEN)
+
+        # same surface, other position
+        self.screen.blit(surface, (3, 2))
+        self.assertEqual(self.screen.matrix[3][2], pymlgame.GREEN)
+
     def test_point_on_screen(self):
         self.assertTrue(self.screen.point_on_screen((0, 0)))
         self.assertTrue(self.screen.point_on_screen((TEST_WIDTH - 1, 0)))
@@ -148,6 +231,52 @@ class SurfaceTest(unittest.TestCase):
             self.assertEqual(self.surface.matrix[z + 1][z], pymlgame.BLACK)
             self.assertEqual(self.surface.matrix[z][z + 1], pymlgame.BLACK)
 
+    def test_draw_line_clipped(self):
+        self.surface.draw_line((-10, 5), (5, 5), pymlgame.RED)
+        self.surface.draw_line((3, -3), (3, 2), pymlgame.BLUE)
+        self.surface.draw_line((7, 7), (7, 7), pymlgame.GREEN)
+        self.surface.draw_line((-5, -5), (-1, -1), pymlgame.WHITE)
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if y == 5 and x <= 5:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED)
+                elif x == 3 and y <= 2:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLUE)
+                elif (x, y) == (7, 7):
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.GREEN)
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+
+    def test_draw_line_far_off(self):
+        start = time.perf_counter()
+        self.surface.draw_line((-3000000, -3000001), (5, 5), pymlgame.RED)
+        self.surface.draw_line((-3000000, 3000000), (3000000, -3000000), pymlgame.BLUE)
+        self.assertLess(time.perf_counter() - start, 0.05)
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if x + y == 0:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLUE)
+                elif x == y <= 5:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED)
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+
+    def test_draw_line_steep(self):
+        self.surface.draw_line((0, 0), (2, 6), pymlgame.RED)
+        for y in range(7):
+            self.assertEqual(sum(self.surface.matrix[x][y] == pymlgame.RED for x in range(3)), 1)
+
+    def test_draw_lines(self):
+        self.surface.draw_lines([(1, 1), (5, 1), (5, 5), (1, 5)], pymlgame.RED, closed=True)
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if 1 <= x <= 5 and 1 <= y <= 5 and (x in (1, 5) or y in (1, 5)):
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED)
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+
     def test_draw_rect(self):
         self.surface.draw_rect((1, 1), (TEST_WIDTH - 2, TEST_HEIGHT - 2), pymlgame.DARKYELLOW, None)
 
@@ -165,12 +294,109 @@ class SurfaceTest(unittest.TestCase):
         self.surface.draw_rect((int(TEST_WIDTH / 2) + 1, int(TEST_HEIGHT / 2) + 1),
                                (1, 1), pymlgame.MAGENTA, pymlgame.DARKCYAN)
 
+    def test_draw_rect_clipped(self):
+        self.surface.draw_rect((-2, -2), (5, 6), pymlgame.RED, pymlgame.BLUE)
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if x == 2 and y <= 3 or x <= 2 and y == 3:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED, '{},{}'.format(x, y))
+                elif x <= 1 and y <= 2:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLUE, '{},{}'.format(x, y))
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK, '{},{}'.format(x, y))
+
+        self.surface.fill(pymlgame.BLACK)
+        self.surface.draw_rect((TEST_WIDTH, 0), (5, 5), pymlgame.RED, pymlgame.BLUE)
+        self.surface.draw_rect((3, 3), (1, 1), pymlgame.RED, pymlgame.BLUE)
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                self.assertEqual(self.surface.matrix[x][y], pymlgame.RED if (x, y) == (3, 3) else pymlgame.BLACK)
+
+    def test_fill_rect(self):
+        self.surface.fill_rect((TEST_WIDTH - 3, 2), (10, 4), pymlgame.GREEN)
+        self.surface.fill_rect((0, TEST_HEIGHT - 2), (TEST_WIDTH, 5), pymlgame.RED)
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if y >= TEST_HEIGHT - 2:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED)
+                elif x >= TEST_WIDTH - 3 and 2 <= y < 6:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.GREEN)
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+
     def test_draw_circle(self):
         #TODO: invent a way to draw this, then a way to test this
         pos = (int(TEST_WIDTH / 2) - 1, int(TEST_HEIGHT / 2) - 1)
         radius = int(min(TEST_WIDTH, TEST_HEIGHT) / 2) - 2
         self.surface.draw_circle(pos, radius, pymlgame.GREEN, None)
 
+    def test_draw_circle_outline(self):
+        pos = (10, 10)
+        radius = 5
+        self.surface.draw_circle(pos, radius, pymlgame.GREEN)
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                color = self.surface.matrix[x][y]
+                # the outline is symmetric in both axes and on the diagonal
+                self.assertEqual(color, self.surface.matrix[2 * pos[0] - x][y] if 0 <= 2 * pos[0] - x < TEST_WIDTH
+                                 else pymlgame.BLACK)
+                self.assertEqual(color, self.surface.matrix[pos[0] + y - pos[1]][pos[1] + x - pos[0]]
+                                 if 0 <= pos[0] + y - pos[1] < TEST_WIDTH and 0 <= pos[1] + x - pos[0] < TEST_HEIGHT
+                                 else pymlgame.BLACK)
+                if color == pymlgame.GREEN:
+                    self.assertAlmostEqual(((x - pos[0])**2 + (y - pos[1])**2)**0.5, radius, delta=0.75)
+        for x, y in [(5, 10), (15, 10), (10, 5), (10, 15)]:
+            self.assertEqual(self.surface.matrix[x][y], pymlgame.GREEN)
+        self.assertEqual(self.surface.matrix[pos[0]][pos[1]], pymlgame.BLACK)
+
+    def test_draw_circle_filled(self):
+        self.surface.draw_circle((0, 0), 3, pymlgame.GREEN, pymlgame.RED)
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                color = self.surface.matrix[x][y]
+                if x**2 + y**2 < 6:
+                    self.assertEqual(color, pymlgame.RED, '{},{}'.format(x, y))
+                elif x**2 + y**2 > 12:
+                    self.assertEqual(color, pymlgame.BLACK, '{},{}'.format(x, y))
+                else:
+                    self.assertEqual(color, pymlgame.GREEN, '{},{}'.format(x, y))
+
+    def test_draw_ellipse(self):
+        pos = (20, 10)
+        self.surface.draw_ellipse(pos, (8, 3), pymlgame.BLUE, pymlgame.YELLOW)
+
+        for x, y in [(12, 10), (28, 10), (20, 7), (20, 13)]:
+            self.assertEqual(self.surface.matrix[x][y], pymlgame.BLUE)
+        for x, y in [(11, 10), (29, 10), (20, 6), (20, 14)]:
+            self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+        for x in range(13, 28):
+            self.assertEqual(self.surface.matrix[x][10], pymlgame.YELLOW)
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if self.surface.matrix[x][y] != pymlgame.BLACK:
+                    self.assertLessEqual(((x - pos[0]) / 8.5)**2 + ((y - pos[1]) / 3.5)**2, 1)
+
+    def test_draw_ellipse_flat(self):
+        def drawn():
+            return {(x, y) for x in range(TEST_WIDTH) for y in range(TEST_HEIGHT)
+                    if self.surface.matrix[x][y] != pymlgame.BLACK}
+
+        for fillcolor in [None, pymlgame.YELLOW]:
+            self.surface.fill(pymlgame.BLACK)
+            self.surface.draw_ellipse((10, 10), (5, 0), pymlgame.RED, fillcolor)
+            self.assertEqual(drawn(), {(x, 10) for x in range(5, 16)})
+            self.surface.fill(pymlgame.BLACK)
+            self.surface.draw_ellipse((10, 10), (0, 3), pymlgame.RED, fillcolor)
+            self.assertEqual(drawn(), {(10, y) for y in range(7, 14)})
+            self.assertEqual(self.surface.matrix[10][10], pymlgame.RED)
+            self.surface.fill(pymlgame.BLACK)
+            self.surface.draw_ellipse((10, 10), (0, 1), pymlgame.RED, fillcolor)
+            self.assertEqual(drawn(), {(10, 9), (10, 10), (10, 11)})
+
     def test_blit(self):
         surface = pymlgame.Surface(TEST_WIDTH - 2, TEST_HEIGHT - 2)
         surface.fill(pymlgame.WHITE)
@@ -183,6 +409,281 @@ class SurfaceTest(unittest.TestCase):
                 else:
                     self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
 
+    def test_blit_clipped(self):
+        surface = pymlgame.Surface(4, 4)
+        surface.fill(pymlgame.RED)
+        self.surface.blit(surface, (-2, TEST_HEIGHT - 1))
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if x < 2 and y == TEST_HEIGHT - 1:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED)
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+
+    def test_blit_area_outside(self):
+        surface = pymlgame.Surface(4, 4)
+        surface.fill(pymlgame.BLUE)
+        surface.draw_dot((1, 1), pymlgame.RED)
+        self.surface.blit(surface, (2, 2), (-1, -1, 3, 3))
+
+        for x in range(TEST_WIDTH):
+            for y in range(TEST_HEIGHT):
+                if (x, y) == (4, 4):
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.RED)
+                elif 3 <= x <= 4 and 3 <= y <= 4:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLUE)
+                else:
+                    self.assertEqual(self.surface.matrix[x][y], pymlgame.BLACK)
+
+    def test_pixels(self):
+        self.assertEqual(len(self.surface.pixels), TEST_WIDTH * TEST_HEIGHT * 3)
+        self.surface.draw_dot((2, 1), pymlgame.CYAN)
+        i = (1 * TEST_WIDTH + 2) * 3
+        self.assertEqual(tuple(self.surface.pixels[i:i + 3]), pymlgame.CYAN)
+
+        self.surface.matrix[3][1] = pymlgame.YELLOW
+        self.assertEqual(tuple(self.surface.pixels[i + 3:i + 6]), pymlgame.YELLOW)
+
+    def test_dirty_rows(self):
+        version = self.surface.version
+        self.assertEqual(self.surface.dirty_rows(version), [])
+        self.surface.draw_dot((3, 4), pymlgame.RED)
+        self.surface.draw_line((0, 10), (5, 12), pymlgame.RED)
+        self.surface.draw_rect((-5, 11), (10, 3), pymlgame.RED)
+        self.surface.draw_circle((5, 30), 2, pymlgame.RED)
+        self.surface.draw_line((-5, 20), (-1, 25), pymlgame.RED)
+        self.assertEqual(self.surface.dirty_rows(version), [(4, 5), (10, 14), (28, 33)])
+        self.assertGreater(self.surface.version, version)
+
+        version = self.surface.version
+        self.surface.replace_color(pymlgame.RED, pymlgame.BLUE)
+        self.assertEqual(self.surface.dirty_rows(version), [(4, 33)])
+        self.surface.fill(pymlgame.BLACK)
+        self.assertEqual(self.surface.dirty_rows(version), [(0, TEST_HEIGHT)])
+
+    def test_replace_color(self):
+        self.surface.draw_rect((0, 0), (4, 4), pymlgame.RED, pymlgame.BLUE)
+        self.surface.replace_color(pymlgame.BLUE, pymlgame.GREEN)
+        self.surface.replace_color(pymlgame.BLACK, pymlgame.WHITE)
+
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.RED)
+        self.assertEqual(self.surface.matrix[1][1], pymlgame.GREEN)
+        self.assertEqual(self.surface.matrix[2][2], pymlgame.GREEN)
+        self.assertEqual(self.surface.matrix[4][4], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[TEST_WIDTH - 1][TEST_HEIGHT - 1], pymlgame.WHITE)
+
+
+class IndexedSurfaceTest(unittest.TestCase):
+    def setUp(self):
+        self.surface = pymlgame.Surface(TEST_WIDTH, TEST_HEIGHT, [pymlgame.BLACK, pymlgame.RED, pymlgame.BLUE])
+
+    def test_pixels(self):
+        self.assertEqual(len(self.surface.pixels), TEST_WIDTH * TEST_HEIGHT)
+        self.surface.draw_dot((1, 0), pymlgame.BLUE)
+        self.surface.draw_dot((2, 0), 1)
+        self.assertEqual(self.surface.pixels[0:3], bytearray([0, 2, 1]))
+        self.assertEqual(self.surface.matrix[1][0], pymlgame.BLUE)
+        self.assertEqual(self.surface.matrix[2][0], pymlgame.RED)
+
+    def test_drawing(self):
+        self.surface.draw_rect((0, 0), (5, 5), pymlgame.RED, pymlgame.GREEN)
+        self.surface.draw_line((0, 6), (4, 6), pymlgame.BLUE)
+        self.surface.draw_circle((20, 20), 4, pymlgame.RED, pymlgame.BLUE)
+
+        self.assertEqual(self.surface.palette[3], pymlgame.GREEN)
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.RED)
+        self.assertEqual(self.surface.matrix[2][2], pymlgame.GREEN)
+        self.assertEqual(self.surface.matrix[4][6], pymlgame.BLUE)
+        self.assertEqual(self.surface.matrix[16][20], pymlgame.RED)
+        self.assertEqual(self.surface.matrix[20][20], pymlgame.BLUE)
+
+    def test_fill_index_zero(self):
+        self.surface.fill(1)
+        self.surface.draw_rect((0, 0), (5, 5), 2, 0)
+        self.surface.draw_circle((20, 20), 4, 2, 0)
+        self.surface.draw_ellipse((20, 30), (6, 3), 2, 0)
+        self.assertEqual(self.surface.matrix[2][2], pymlgame.BLACK)
+        self.assertEqual(self.surface.matrix[20][20], pymlgame.BLACK)
+        self.assertEqual(self.surface.matrix[20][30], pymlgame.BLACK)
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.BLUE)
+
+    def test_full_palette(self):
+        surface = pymlgame.Surface(2, 2, [(i, i, i) for i in range(256)])
+        self.assertRaises(ValueError, surface.draw_dot, (0, 0), pymlgame.RED)
+
+    def test_replace_color(self):
+        self.surface.draw_dot((0, 0), pymlgame.RED)
+        version = self.surface.version
+        self.surface.replace_color(pymlgame.RED, pymlgame.GREEN)
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.GREEN)
+        self.assertEqual(self.surface.pixels[0], 1)
+        self.assertEqual(self.surface.dirty_rows(version), [(0, TEST_HEIGHT)])
+
+    def test_cycle_palette(self):
+        self.surface.draw_dot((0, 0), pymlgame.RED)
+        self.surface.draw_dot((1, 0), pymlgame.BLUE)
+        self.surface.cycle_palette(1)
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.BLUE)
+        self.assertEqual(self.surface.matrix[1][0], pymlgame.RED)
+        self.assertEqual(self.surface.matrix[2][0], pymlgame.BLACK)
+
+    def test_blit(self):
+        rgb = pymlgame.Surface(TEST_WIDTH, TEST_HEIGHT)
+        self.surface.draw_dot((1, 1), pymlgame.BLUE)
+        rgb.blit(self.surface)
+        self.assertEqual(rgb.matrix[1][1], pymlgame.BLUE)
+        self.assertEqual(rgb.matrix[0][0], pymlgame.BLACK)
+
+        other = pymlgame.Surface(3, 3, [pymlgame.WHITE, pymlgame.BLUE])
+        other.draw_dot((0, 0), pymlgame.BLUE)
+        self.surface.blit(other, (2, 2))
+        self.assertEqual(self.surface.matrix[2][2], pymlgame.BLUE)
+        self.assertEqual(self.surface.matrix[3][3], pymlgame.WHITE)
+
+        rgb.fill(pymlgame.YELLOW)
+        self.surface.blit(rgb, (TEST_WIDTH - 1, 0))
+        self.assertEqual(self.surface.matrix[TEST_WIDTH - 1][0], pymlgame.YELLOW)
+        self.assertEqual(self.surface.matrix[TEST_WIDTH - 2][0], pymlgame.BLACK)
+
+    def test_screen(self):
+        screen = pymlgame.Screen(TEST_HOST, TEST_PORT, 4, 2, palette=[pymlgame.BLACK, pymlgame.GREEN])
+        screen.draw_dot((3, 1), pymlgame.GREEN)
+        self.assertEqual(bytes(screen.serialize()[-7:-4]), bytes(pymlgame.GREEN))
+        screen.set_palette_color(1, pymlgame.MAGENTA)
+        self.assertEqual(bytes(screen.serialize()[-7:-4]), bytes(pymlgame.MAGENTA))
+        screen.close()
+
+
+class SpriteTest(unittest.TestCase):
+    def setUp(self):
+        # two 3x2 frames, the second one is the first one in blue
+        sheet = pymlgame.Surface(6, 2)
+        sheet.fill(pymlgame.MAGENTA)
+        sheet.draw_line((0, 0), (1, 0), pymlgame.RED)
+        sheet.draw_dot((2, 1), pymlgame.RED)
+        sheet.draw_line((3, 0), (4, 0), pymlgame.BLUE)
+        sheet.draw_dot((5, 1), pymlgame.BLUE)
+        self.sheet = pymlgame.SpriteSheet(sheet, 3, 2)
+        self.sprite = pymlgame.Sprite(self.sheet, colorkey=pymlgame.MAGENTA, fps=5)
+        self.surface = pymlgame.Surface(TEST_WIDTH, TEST_HEIGHT)
+
+    def drawn(self, color=pymlgame.RED):
+        return sorted((x, y) for x in range(TEST_WIDTH) for y in range(TEST_HEIGHT)
+                      if self.surface.matrix[x][y] == color)
+
+    def test_sheet(self):
+        self.assertEqual(len(self.sheet), 2)
+        self.assertEqual(self.sheet[1].width, 3)
+        self.assertEqual(self.sheet[1].matrix[0][0], pymlgame.BLUE)
+        self.assertEqual(self.sheet[1].matrix[0][1], pymlgame.MAGENTA)
+
+    def test_draw(self):
+        self.sprite.draw(self.surface, (10, 10))
+        self.assertEqual(self.drawn(), [(10, 10), (11, 10), (12, 11)])
+        self.assertEqual(self.drawn(pymlgame.MAGENTA), [])
+
+    def test_draw_clipped(self):
+        self.sprite.draw(self.surface, (-1, TEST_HEIGHT - 1))
+        self.assertEqual(self.drawn(), [(0, TEST_HEIGHT - 1)])
+
+    def test_transform(self):
+        self.sprite.draw(self.surface, (0, 0), flip_x=True)
+        self.assertEqual(self.drawn(), [(0, 1), (1, 0), (2, 0)])
+        self.surface.fill(pymlgame.BLACK)
+        self.sprite.draw(self.surface, (0, 0), rotate=90)
+        self.assertEqual(self.drawn(), [(0, 2), (1, 0), (1, 1)])
+        self.assertIs(self.sprite.get_frame(0, rotate=90), self.sprite.get_frame(0, rotate=-270))
+
+    def test_animation(self):
+        clock = pymlgame.Clock(10)
+        self.assertEqual(self.sprite.frame_index(clock), 0)
+        clock.ticks = 2
+        self.assertEqual(self.sprite.frame_index(clock), 1)
+        clock.ticks = 4
+        self.sprite.draw(self.surface, (0, 0), clock=clock)
+        self.assertEqual(self.drawn(), [(0, 0), (1, 0), (2, 1)])
+
+    def test_indexed(self):
+        surface = pymlgame.Surface(4, 4, [pymlgame.BLACK])
+        self.sprite.draw(surface, (0, 0), index=1)
+        self.assertEqual(surface.matrix[0][0], pymlgame.BLUE)
+        self.assertEqual(surface.matrix[0][1], pymlgame.BLACK)
+        self.assertNotIn(pymlgame.MAGENTA, surface.palette)
+
+
+class FontTest(unittest.TestCase):
+    def setUp(self):
+        self.font = pymlgame.Font(cache_size=2)
+        self.surface = pymlgame.Surface(TEST_WIDTH, TEST_HEIGHT)
+
+    def test_size(self):
+        self.assertEqual(self.font.size('ABC'), (17, 5))
+        self.assertEqual(self.font.size(''), (0, 5))
+
+    def test_draw(self):
+        self.font.draw(self.surface, (1, 2), 'iA', pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[1][2], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[3][3], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[2][3], pymlgame.BLACK)
+        # the second glyph starts after one pixel of spacing
+        self.assertEqual(self.surface.matrix[6][2], pymlgame.BLACK)
+        self.assertEqual(self.surface.matrix[7][3], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[8][3], pymlgame.BLACK)
+
+    def test_render_cache(self):
+        abc = self.font.render('ABC', pymlgame.WHITE)
+        self.assertEqual((abc.width, abc.height), (17, 5))
+        self.assertIs(self.font.render('ABC', pymlgame.WHITE), abc)
+        red = self.font.render('ABC', pymlgame.RED)
+        self.assertIsNot(red, abc)
+        # the least recently used text is dropped
+        self.font.render('ABC', pymlgame.WHITE)
+        self.font.render('XYZ', pymlgame.WHITE)
+        self.assertIs(self.font.render('ABC', pymlgame.WHITE), abc)
+        self.assertIsNot(self.font.render('ABC', pymlgame.RED), red)
+
+    def test_from_surface(self):
+        sheet = pymlgame.Surface(6, 3)
+        sheet.fill(pymlgame.WHITE)
+        sheet.draw_line((0, 0), (2, 2), pymlgame.BLACK)
+        sheet.draw_line((3, 1), (5, 1), pymlgame.BLACK)
+        font = pymlgame.Font.from_surface(sheet, '\\-', 3, 3)
+        font.draw(self.surface, (0, 0), '-\\', pymlgame.RED)
+        self.assertEqual([(x, y) for y in range(3) for x in range(7) if self.surface.matrix[x][y] == pymlgame.RED],
+                         [(4, 0), (0, 1), (1, 1), (2, 1), (5, 1), (6, 2)])
+
+    def test_marquee(self):
+        marquee = pymlgame.Marquee(self.font, 'I', pymlgame.WHITE, 8, gap=3)
+        self.assertEqual(marquee.period, 8)
+        marquee.draw(self.surface, (0, 0))
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[2][1], pymlgame.WHITE)
+        marquee.scroll(2)
+        marquee.draw(self.surface, (0, 0))
+        self.assertEqual(self.surface.matrix[0][0], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[0][1], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[2][1], pymlgame.BLACK)
+        self.assertEqual(self.surface.matrix[6][0], pymlgame.WHITE)
+        self.assertEqual(self.surface.matrix[8][0], pymlgame.BLACK)
+        marquee.scroll(7)
+        self.assertEqual(marquee.offset, 1)
+
+
+class FakeTime(object):
+    """
+    Stands in for the time module, time only goes on when somebody sleeps.
+    """
+    def __init__(self, oversleep=0.0):
+        self.now = 0.0
+        self.oversleep = oversleep
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds + self.oversleep
+
 
 class ClockTest(unittest.TestCase):
     def setUp(self):
@@ -195,6 +696,554 @@ class ClockTest(unittest.TestCase):
         self.assertGreater(after, before)
         self.assertAlmostEqual(before, after - 1/24, 2)
 
+    def test_no_drift(self):
+        # sleeping overshoots by a few ms like on a busy machine, the deadlines must not move because of it
+        fake = FakeTime(oversleep=0.003)
+        with mock.patch.object(pymlgame.clock, 'time', fake):
+            clock = pymlgame.Clock(100)
+            for _ in range(20):
+                # pretend to do some work in every frame
+                fake.now += 0.005
+                clock.tick()
+        self.assertAlmostEqual(fake.now, 0.203, 9)
+        self.assertAlmostEqual(clock.frame_time, 0.01, 9)
+        # the first frame is late by the oversleep, all others are right on time
+        self.assertAlmostEqual(clock.actual_fps, 20 / 0.203, 6)
+        self.assertEqual(clock.ticks, 20)
+        self.assertEqual(clock.overruns, 0)
+
+    def test_overrun(self):
+        clock = pymlgame.Clock(100, spin=0.001)
+        time.sleep(0.03)
+        clock.tick()
+        self.assertEqual(clock.overruns, 1)
+        before = time.perf_counter()
+        clock.tick()
+        # no burst of frames to catch up
+        self.assertGreater(time.perf_counter() - before, 0.008)
+        self.assertEqual(clock.overruns, 1)
+
+
+class GameLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.alphas = []
+
+    def update(self):
+        self.calls.append('update')
+        if self.loop.ticks + 1 >= 30:
+            self.loop.stop()
+
+    def render(self, alpha):
+        self.calls.append('render')
+        self.alphas.append(alpha)
+
+    def test_rates(self):
+        self.loop = pymlgame.GameLoop(self.update, self.render, lambda: self.calls.append('events'), 100, 25)
+        before = time.perf_counter()
+        self.loop.run()
+        after = time.perf_counter()
+
+        self.assertEqual(self.loop.ticks, 30)
+        self.assertAlmostEqual(after - before, 0.3, 1)
+        self.assertAlmostEqual(self.loop.frames, 7, delta=2)
+        self.assertEqual(self.calls.count('events'), 30)
+        # the start state gets rendered before the first tick
+        self.assertEqual(self.calls[:3], ['render', 'events', 'update'])
+        for alpha in self.alphas:
+            self.assertTrue(0 <= alpha <= 1)
+
+    def test_skip_frames(self):
+        def slow_update():
+            time.sleep(0.015)
+            self.update()
+
+        self.loop = pymlgame.GameLoop(slow_update, self.render, tick_rate=100, render_rate=100, max_frame_skip=4)
+        self.loop.run()
+
+        self.assertEqual(self.loop.ticks, 30)
+        self.assertGreater(self.loop.skipped_frames, 0)
+        self.assertLess(self.loop.frames, 15)
+        self.assertGreater(self.loop.frames, 0)
+
+    def test_too_slow(self):
+        frames = []
+        start = time.perf_counter()
+
+        def slow_update():
+            # every tick takes longer than a tick is long
+            time.sleep(0.015)
+            if time.perf_counter() - start >= 3:
+                self.loop.stop()
+
+        self.loop = pymlgame.GameLoop(slow_update, lambda alpha: frames.append(time.perf_counter() - start),
+                                      tick_rate=100, render_rate=30, max_frame_skip=4)
+        self.loop.run()
+
+        self.assertGreater(len(frames), 20)
+        # frames keep coming until the end
+        self.assertGreater(frames[-1], 2.5)
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = pymlgame.PROFILER
+        self.profiler.reset()
+
+    def tearDown(self):
+        self.profiler.disable()
+        self.profiler.reset()
+
+    def test_disabled(self):
+        draw_line = pymlgame.Surface.draw_line
+        with self.profiler.phase('update'):
+            pymlgame.Surface(4, 4).draw_line((0, 0), (3, 3), pymlgame.RED)
+        self.assertEqual(self.profiler.timings, {})
+        self.assertEqual(self.profiler.counts, {})
+        self.profiler.enable()
+        self.assertIsNot(pymlgame.Surface.draw_line, draw_line)
+        self.profiler.disable()
+        self.assertIs(pymlgame.Surface.draw_line, draw_line)
+
+    def test_phases(self):
+        self.profiler.enable()
+        screen = pymlgame.Screen(TEST_HOST, TEST_PORT, 8, 8)
+        surface = pymlgame.Surface(4, 4)
+        for _ in range(10):
+            with self.profiler.phase('update'):
+                surface.draw_line((0, 0), (3, 3), pymlgame.RED)
+                surface.draw_dot((1, 0), pymlgame.RED)
+                surface.draw_dot((2, 0), pymlgame.RED)
+            screen.blit(surface)
+            screen.update()
+        pymlgame.get_events()
+        screen.close()
+
+        self.assertEqual(self.profiler.counts['Surface.draw_dot'], 20)
+        self.assertEqual(self.profiler.counts['Surface.draw_line'], 10)
+        for name in ['update', 'screen.blit', 'screen.update', 'screen.serialize', 'events']:
+            stats = self.profiler.stats(name)
+            self.assertGreater(stats['count'], 0)
+            self.assertLessEqual(stats['p50'], stats['p99'])
+            self.assertLessEqual(stats['p99'], stats['max'])
+        self.assertIn('screen.serialize', self.profiler.summary())
+
+    def test_ring(self):
+        profiler = pymlgame.profiler.Profiler(size=10)
+        for n in range(100):
+            profiler.record('phase', n)
+        stats = profiler.stats('phase')
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['max'], 99)
+        self.assertIn(stats['p50'], (94, 95))
+        self.assertEqual(profiler.stats('nothing')['count'], 0)
+
+    def test_dump(self):
+        self.profiler.enable()
+        out = io.StringIO()
+        self.assertTrue(self.profiler.dump(0, out))
+        self.assertFalse(self.profiler.dump(60, out))
+        self.assertIn('p99', out.getvalue())
+
+
+class EventQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = pymlgame.event.EventQueue()
+
+    def test_drain(self):
+        self.assertTrue(self.queue.empty())
+        self.assertEqual(self.queue.drain(), [])
+        for n in range(25):
+            self.queue.put(pymlgame.event.Event('uid', pymlgame.E_KEYDOWN, n % 14))
+        self.assertEqual(len(self.queue), 25)
+        events = self.queue.drain()
+        self.assertEqual(len(events), 25)
+        self.assertEqual([e.button for e in events[:3]], [0, 1, 2])
+        self.assertTrue(self.queue.empty())
+
+    def test_drain_maximum(self):
+        self.queue.put_many(list(range(5)))
+        self.assertEqual(self.queue.drain(2), [0, 1])
+        self.assertEqual(self.queue.drain(10), [2, 3, 4])
+
+    def test_event(self):
+        key = pymlgame.event.Event('uid', pymlgame.E_KEYUP, pymlgame.CTLR_A, 12.5)
+        self.assertEqual((key.uid, key.type, key.button, key.time), ('uid', pymlgame.E_KEYUP, pymlgame.CTLR_A, 12.5))
+        message = pymlgame.event.Event('uid', pymlgame.E_MESSAGE, 'hi')
+        self.assertIsNone(message.button)
+        self.assertEqual(message.data, 'hi')
+        self.assertLessEqual(message.time, time.time())
+        self.assertFalse(hasattr(message, '__dict__'))
+
+    def test_batch(self):
+        self.queue.put(pymlgame.event.Event('a', pymlgame.E_KEYDOWN, 3, 1.0))
+        self.queue.put(pymlgame.event.Event('b', pymlgame.E_PING, None, 2.0))
+        batch = self.queue.drain_batch()
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.uids, ['a', 'b'])
+        self.assertEqual(list(batch.types), [pymlgame.E_KEYDOWN, pymlgame.E_PING])
+        self.assertEqual(list(batch.buttons), [3, -1])
+        self.assertEqual(list(batch.times), [1.0, 2.0])
+        self.assertEqual(batch[0].button, 3)
+        self.assertTrue(self.queue.empty())
+
+    def test_get_events(self):
+        pymlgame.get_events()
+        pymlgame.CONTROLLER.queue.put_many(list(range(15)))
+        self.assertEqual(pymlgame.get_event(), 0)
+        self.assertEqual(pymlgame.get_events(4), [1, 2, 3, 4])
+        self.assertEqual(len(pymlgame.get_events()), 10)
+        self.assertFalse(pymlgame.get_event())
+
+
+class ControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = pymlgame.Controller('127.0.0.1', 0)
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.bind(('127.0.0.1', 0))
+        self.uid = self.controller._new_controller('127.0.0.1', self.client.getsockname()[1])
+        self.controller.queue.drain()
+
+    def tearDown(self):
+        self.controller.sock.close()
+        self.client.close()
+
+    def events(self):
+        return [(e.type, e.button) for e in self.controller.queue.drain()]
+
+    def test_states(self):
+        self.controller._update_states(self.uid, '10000000000001')
+        self.assertEqual(self.events(), [(pymlgame.E_KEYDOWN, 0), (pymlgame.E_KEYDOWN, 13)])
+        self.controller._update_states(self.uid, '00100000000001')
+        self.assertEqual(self.events(), [(pymlgame.E_KEYUP, 0), (pymlgame.E_KEYDOWN, 2),
+                                         (pymlgame.E_KEYPRESSED, 13)])
+
+    def test_states_without_keypressed(self):
+        self.controller.keypressed = False
+        self.controller._update_states(self.uid, '01000000000000')
+        self.controller._update_states(self.uid, '01000000000000')
+        self.assertEqual(self.events(), [(pymlgame.E_KEYDOWN, 1)])
+
+    def test_handle(self):
+        port = self.client.getsockname()[1]
+        handle = self.controller._handle
+        self.assertTrue(handle('/controller/{}/states/01000000000000'.format(self.uid).encode(), '127.0.0.1'))
+        self.assertTrue(handle('/controller/{}/text/a/b'.format(self.uid).encode(), '127.0.0.1'))
+        self.assertTrue(handle('/controller/{}/ping/{}'.format(self.uid, port).encode(), '127.0.0.1'))
+        self.assertEqual([(e.type, e.data) for e in self.controller.queue.drain()],
+                         [(pymlgame.E_KEYDOWN, 1), (pymlgame.E_MESSAGE, 'a/b'), (pymlgame.E_PING, None)])
+        self.assertEqual(self.controller.controllers[self.uid].port, port)
+        self.assertTrue(handle('/controller/{}/kthxbye'.format(self.uid).encode(), '127.0.0.1'))
+        self.assertNotIn(self.uid, self.controller.controllers)
+
+        self.assertTrue(handle('/controller/new/{}'.format(port).encode(), '127.0.0.1'))
+        self.assertEqual(self.client.recv(1024)[:5], b'/uid/')
+
+    def test_handle_batch(self):
+        puts = []
+        put_many = self.controller.queue.put_many
+        self.controller.queue.put_many = lambda events: puts.append(len(events)) or put_many(events)
+        sender = ('127.0.0.1', self.client.getsockname()[1])
+        self.controller._handle_batch([('/controller/{}/states/11000000000000'.format(self.uid).encode(), sender),
+                                       (b'garbage', sender),
+                                       ('/controller/{}/text/hi'.format(self.uid).encode(), sender)])
+        self.assertEqual(puts, [3])
+        self.assertEqual(self.events(), [(pymlgame.E_KEYDOWN, 0), (pymlgame.E_KEYDOWN, 1), (pymlgame.E_MESSAGE, None)])
+        self.controller._update_states(self.uid, '00000000000000')
+        self.assertEqual(len(self.events()), 2)
+
+    def test_receive_burst(self):
+        controller = pymlgame.Controller('127.0.0.1', 0, rcvbuf=1 << 20)
+        self.assertGreaterEqual(controller.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 1 << 16)
+        controller.daemon = True
+        controller.start()
+        uid = controller._new_controller('127.0.0.1', self.client.getsockname()[1])
+        controller.queue.drain()
+        address = controller.sock.getsockname()
+        for n in range(500):
+            states = '10000000000000' if n % 2 else '00000000000000'
+            self.client.sendto('/controller/{}/states/{}'.format(uid, states).encode(), address)
+        events = []
+        deadline = time.time() + 2
+        while len(events) < 499 and time.time() < deadline:
+            events.extend(controller.queue.drain())
+            time.sleep(0.01)
+        controller.stop()
+        self.assertEqual(len(events), 499)
+
+    def test_handle_malformed(self):
+        for data in [b'', b'/', b'/controller/', b'/controller/new', b'/controller/new/port', b'/controller/new/99999',
+                     b'/other/x/ping/1', b'controller/x/ping/1', '/controller/{}/ping/x'.format(self.uid).encode(),
+                     '/controller/{}/dance/1'.format(self.uid).encode(), b'/controller/\xff/text/x']:
+            self.assertFalse(self.controller._handle(data, '127.0.0.1'), data)
+        self.assertEqual(self.controller.malformed, 11)
+
+    def test_handle_bad_port(self):
+        port = self.client.getsockname()[1]
+        for data in [b'/controller/new/99999', b'/controller/new/-1']:
+            self.assertFalse(self.controller._handle(data, '127.0.0.9'), data)
+        self.assertNotIn('127.0.0.9', self.controller.addresses)
+        self.assertEqual(len(self.controller.controllers), 1)
+        self.assertTrue(self.controller.queue.empty())
+        self.assertFalse(self.controller._handle('/controller/{}/ping/99999'.format(self.uid).encode(), '127.0.0.1'))
+        self.assertEqual(self.controller.controllers[self.uid].port, port)
+        self.assertEqual(self.controller.malformed, 3)
+        # the controller can still connect with a good port
+        self.assertTrue(self.controller._handle('/controller/new/{}'.format(port).encode(), '127.0.0.9'))
+        self.assertEqual([e.type for e in self.controller.queue.drain()], [pymlgame.E_NEWCTLR])
+
+    def test_registry(self):
+        port = self.client.getsockname()[1]
+        self.assertIs(self.controller.addresses['127.0.0.1'], self.controller.controllers[self.uid])
+        self.assertFalse(self.controller._new_controller('127.0.0.1', port))
+        self.assertEqual(self.client.recv(1024), '/uid/{}'.format(self.uid).encode())
+        self.controller._ping(self.uid, '127.0.0.2', port)
+        self.assertNotIn('127.0.0.1', self.controller.addresses)
+        self.assertEqual(self.controller.addresses['127.0.0.2'].uid, self.uid)
+        self.controller._got_message(self.uid, 'hello')
+        self.assertEqual(self.controller.controllers[self.uid].states, 0)
+        self.controller._del_controller(self.uid)
+        self.assertEqual(self.controller.controllers, {})
+        self.assertEqual(self.controller.addresses, {})
+
+    def test_expire(self):
+        port = self.client.getsockname()[1]
+        other = self.controller._new_controller('127.0.0.2', port)
+        self.controller.queue.drain()
+        now = time.time()
+        self.controller._expire(now + 59)
+        self.assertEqual(len(self.controller.controllers), 2)
+        self.controller.controllers[self.uid].last_seen = now + 30
+        self.controller._expire(now + 61)
+        self.assertEqual(list(self.controller.controllers), [self.uid])
+        self.assertEqual([(e.uid, e.type) for e in self.controller.queue.drain()], [(other, pymlgame.E_DISCONNECT)])
+        self.controller._expire(now + 91)
+        self.assertEqual(self.controller.controllers, {})
+        self.assertEqual(self.controller._deadlines, [])
+
+    def test_expire_timeout(self):
+        controller = pymlgame.Controller('127.0.0.1', 0, timeout=0.1)
+        controller.daemon = True
+        controller.start()
+        controller._new_controller('127.0.0.1', self.client.getsockname()[1])
+        time.sleep(0.3)
+        controller.stop()
+        self.assertEqual(controller.controllers, {})
+        self.assertEqual(controller.queue.drain()[-1].type, pymlgame.E_DISCONNECT)
+        controller.join()
+        controller.sock.close()
+
+    def test_send(self):
+        self.client.recv(1024)
+        self.assertEqual(self.controller.send(self.uid, pymlgame.E_MESSAGE, 'hello'), 14)
+        self.assertEqual(self.client.recv(1024), b'/message/hello')
+        self.controller.send(self.uid, pymlgame.E_RUMBLE, 500)
+        self.assertEqual(self.client.recv(1024), b'/rumble/500')
+        self.assertFalse(self.controller.send('unknown', pymlgame.E_MESSAGE, 'hello'))
+        self.assertFalse(self.controller.send(self.uid, pymlgame.E_PING))
+
+    def test_send_buffer_full(self):
+        def full(data, address):
+            raise BlockingIOError()
+
+        self.controller._sendto = full
+        self.assertFalse(self.controller.send(self.uid, pymlgame.E_RUMBLE, 500))
+        self.assertEqual(self.controller.broadcast(pymlgame.E_RUMBLE, 500), 0)
+
+    def test_broadcast(self):
+        self.client.recv(1024)
+        other = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        other.bind(('127.0.0.2', 0))
+        uid = self.controller._new_controller('127.0.0.2', other.getsockname()[1])
+        other.recv(1024)
+        self.assertEqual(self.controller.broadcast(pymlgame.E_RUMBLE, 200), 2)
+        self.assertEqual(self.client.recv(1024), b'/rumble/200')
+        self.assertEqual(other.recv(1024), b'/rumble/200')
+        self.assertEqual(self.controller.broadcast(pymlgame.E_MESSAGE, 'hi', uids=[uid, 'unknown']), 1)
+        self.assertEqual(other.recv(1024), b'/message/hi')
+        self.assertEqual(self.controller.broadcast(pymlgame.E_PING), 0)
+        other.close()
+
+    def test_broadcast_bad_record(self):
+        self.client.recv(1024)
+        bad = self.controller._new_controller('127.0.0.2', self.client.getsockname()[1])
+        self.controller.controllers[bad].port = 99999
+        # the bad record comes first, the good one still has to get the datagram
+        uids = [bad, self.uid]
+        self.assertEqual(self.controller.broadcast(pymlgame.E_RUMBLE, 100, uids=uids), 1)
+        self.assertEqual(self.client.recv(1024), b'/rumble/100')
+        self.assertFalse(self.controller.send(bad, pymlgame.E_RUMBLE, 100))
+
+    def test_subscribe(self):
+        self.controller.subscribe(types=[pymlgame.E_KEYUP, pymlgame.E_MESSAGE])
+        self.controller._update_states(self.uid, '11000000000000')
+        self.controller._update_states(self.uid, '01000000000000')
+        self.controller._ping(self.uid, '127.0.0.1', self.client.getsockname()[1])
+        self.assertEqual(self.events(), [(pymlgame.E_KEYUP, 0)])
+        self.assertEqual(self.controller.get_state(self.uid)[0], 2)
+
+        self.controller.subscribe(uids=['other'])
+        self.controller._update_states(self.uid, '00000000000000')
+        self.controller._got_message(self.uid, 'hello')
+        self.assertEqual(self.events(), [])
+
+        self.controller.subscribe()
+        self.controller._got_message(self.uid, 'hello')
+        self.assertEqual(self.controller.queue.drain()[0].data, 'hello')
+
+    def test_get_states(self):
+        self.controller._update_states(self.uid, '00100000000000')
+        states = self.controller.get_states()
+        self.assertEqual(states[self.uid][0], 1 << pymlgame.CTLR_LEFT)
+        self.assertLessEqual(states[self.uid][1], time.time())
+        self.controller._update_states(self.uid, '00000000000000')
+        self.assertEqual(states[self.uid][0], 1 << pymlgame.CTLR_LEFT)
+        self.assertEqual(self.controller.get_state(self.uid)[0], 0)
+        self.assertIsNone(self.controller.get_state('unknown'))
+        self.controller._del_controller(self.uid)
+        self.assertEqual(self.controller.get_states(), {})
+
+    def test_is_pressed(self):
+        controller = pymlgame.CONTROLLER
+        pymlgame.CONTROLLER = self.controller
+        try:
+            self.controller._update_states(self.uid, '00100000000000')
+            self.assertTrue(pymlgame.is_pressed(self.uid, pymlgame.CTLR_LEFT))
+            self.assertFalse(pymlgame.is_pressed(self.uid, pymlgame.CTLR_RIGHT))
+            self.assertFalse(pymlgame.is_pressed('unknown', pymlgame.CTLR_LEFT))
+            self.assertIn(self.uid, pymlgame.get_states())
+        finally:
+            pymlgame.CONTROLLER = controller
+
+    def test_invalid_states(self):
+        for states in ['0100', '0100000000000x', '0_000000000001']:
+            self.controller._update_states(self.uid, states)
+        self.controller._update_states('unknown', '11111111111111')
+        self.assertEqual(self.events(), [])
+
+
+class AsyncControllerTest(unittest.TestCase):
+    def test_events(self):
+        async def main():
+            controller = await pymlgame.create_controller('127.0.0.1', 0)
+            client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            client.bind(('127.0.0.1', 0))
+            client.setblocking(False)
+            address = controller.transport.get_extra_info('sockname')
+            self.assertEqual(await controller.get_events(timeout=0.01), [])
+            client.sendto('/controller/new/{}'.format(client.getsockname()[1]).encode(), address)
+            events = await controller.get_events(timeout=1)
+            self.assertEqual(events[0].type, pymlgame.E_NEWCTLR)
+            await asyncio.sleep(0.01)
+            self.assertEqual(client.recv(1024), '/uid/{}'.format(events[0].uid).encode())
+            client.sendto('/controller/{}/states/10000000000000'.format(events[0].uid).encode(), address)
+            events = await controller.get_events(timeout=1)
+            self.assertEqual((events[0].type, events[0].button), (pymlgame.E_KEYDOWN, 0))
+            controller.close()
+            client.close()
+
+        asyncio.run(main())
+
+    def test_loop(self):
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(('127.0.0.1', 0))
+        screen = pymlgame.Screen('127.0.0.1', sink.getsockname()[1], 8, 8)
+        ticks = []
+
+        def update():
+            ticks.append(time.perf_counter())
+            if len(ticks) == 5:
+                loop.stop()
+
+        async def handle_events():
+            # a coroutine callback gets awaited
+            await asyncio.sleep(0)
+
+        def render(alpha):
+            display.update()
+
+        async def main():
+            nonlocal display
+            display = await pymlgame.connect_screen(screen)
+            await pymlgame.run_game_loop(loop)
+            display.close()
+
+        display = None
+        loop = pymlgame.GameLoop(update, render, handle_events, tick_rate=100)
+        asyncio.run(main())
+        self.assertEqual(loop.ticks, 5)
+        self.assertFalse(loop.running)
+        self.assertGreater(screen.frames_sent, 0)
+        self.assertEqual(len(sink.recv(1024)), 8 * 8 * 3 + 4)
+        screen.close()
+        sink.close()
+
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'needs SO_REUSEPORT')
+class ShardedControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = pymlgame.ShardedController('127.0.0.1', 0, shards=2, keypressed=False)
+        self.controller.daemon = True
+        self.controller.start()
+        self.address = ('127.0.0.1', self.controller.port)
+        self.clients = []
+        for n in range(4):
+            # one address per client, the registry allows one controller per address
+            client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            client.bind(('127.0.0.{}'.format(n + 2), 0))
+            client.settimeout(2)
+            self.clients.append(client)
+
+    def tearDown(self):
+        self.controller.stop()
+        self.controller.sock.close()
+        for client in self.clients:
+            client.close()
+
+    def events(self, count):
+        events = []
+        deadline = time.time() + 2
+        while len(events) < count and time.time() < deadline:
+            events.extend(self.controller.queue.drain())
+            time.sleep(0.01)
+        return events
+
+    def test_events(self):
+        uids = []
+        for client in self.clients:
+            client.sendto('/controller/new/{}'.format(client.getsockname()[1]).encode(), self.address)
+            uids.append(client.recv(1024)[5:].decode())
+        self.assertEqual(len(set(uids)), 4)
+        self.assertEqual(sorted(uids), sorted(self.controller.controllers))
+        self.assertEqual(len(self.events(4)), 4)
+
+        for uid, client in zip(uids, self.clients):
+            for states in ['10000000000000', '10000000000000', '00000000000000']:
+                client.sendto('/controller/{}/states/{}'.format(uid, states).encode(), self.address)
+            client.sendto(b'garbage', self.address)
+        events = self.events(8)
+        for uid in uids:
+            self.assertEqual([e.type for e in events if e.uid == uid], [pymlgame.E_KEYDOWN, pymlgame.E_KEYUP])
+        deadline = time.time() + 2
+        while self.controller.malformed < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.controller.malformed, 4)
+
+
+class ShardTest(unittest.TestCase):
+    def test_prune(self):
+        shard = pymlgame.sharded._Shard(keypressed=False)
+        shard._update_states('old', '10000000000000')
+        shard._update_states('new', '10000000000000')
+        now = time.time()
+        shard._forwarded['old'] = (1, now - 10)
+        shard.prune(now)
+        self.assertEqual(list(shard._forwarded), ['new'])
+        shard.records = []
+        shard._update_states('new', '10000000000000')
+        shard._update_states('old', '10000000000000')
+        self.assertEqual([record[1] for record in shard.records], ['old'])
+
 
 class Controllertests(unittest.TestCase):
     def setUp(self):